@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,17 +42,21 @@ INSTALLED_APPS = [
 
     "blog.apps.BlogConfig",
     "crispy_forms",
+    "rest_framework",
     "shop",
     "blog",
 
 ]
 
 MIDDLEWARE = [
+    "shop.profiling.ProfilingMiddleware",
+    "shop.middleware.ReplicaPinningMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    "shop.middleware.CartMiddleware",
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -71,7 +76,13 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                "shop.context_processors.cart",
             ],
+            'libraries': {
+                "renditions": "templates.templatetags.renditions",
+                "specifications": "templates.templatetags.specifications",
+                "slider_tag": "templates.templatetags.slider_tag",
+            },
         },
     },
 ]
@@ -82,13 +93,92 @@ WSGI_APPLICATION = 'my_online_store.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+CONN_MAX_AGE = int(os.environ.get("DJANGO_CONN_MAX_AGE", 60))
+
+# WAL lets readers work while a checkout transaction holds the write lock
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -20000,
+    "temp_store": "MEMORY",
+    "mmap_size": 128 * 1024 * 1024,
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'OPTIONS': {
+            'timeout': 20,
+        },
+        'PRAGMAS': SQLITE_PRAGMAS,
+        # a file database, so the threaded tests get real locking, kept out of the repository
+        'TEST': {
+            'NAME': os.path.join(tempfile.gettempdir(), 'my_online_store_test.sqlite3'),
+        },
+    },
+    # a separate connection to the same WAL file stands in for a streaming replica locally
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get("DJANGO_REPLICA_NAME", BASE_DIR / 'db.sqlite3'),
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'OPTIONS': {
+            'timeout': 20,
+        },
+        'PRAGMAS': {**SQLITE_PRAGMAS, "query_only": "ON"},
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    },
+}
+
+DATABASE_ROUTERS = ["shop.database.CatalogueRouter"]
+
+SHOP_READ_REPLICAS = ["replica"]
+
+SHOP_REPLICA_PIN_SECONDS = 5
+
+SHOP_DB_HEALTH_CHECKS = True
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get("DJANGO_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.environ.get("DJANGO_CACHE_LOCATION", "shop"),
     }
 }
 
+SHOP_CACHE_TIMEOUT = 60 * 15
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": ["rest_framework.renderers.JSONRenderer"],
+    "UNAUTHENTICATED_USER": None,
+}
+
+SHOP_IMAGE_WORKERS = int(os.environ.get("SHOP_IMAGE_WORKERS", 2))
+
+SHOP_IMAGE_MAX_PIXELS = 4096 * 4096
+
+SHOP_ASYNC_DB_WORKERS = int(os.environ.get("SHOP_ASYNC_DB_WORKERS", 8))
+
+# Off by default: the middleware wraps every connection and patches Template.render process-wide.
+SHOP_PROFILING = os.environ.get("SHOP_PROFILING", "0") == "1"
+
+SHOP_METRICS_BUFFER_SIZE = 1000
+
+# Lets scrapers read /shop/_metrics with "Authorization: Bearer <token>"; staff users need no token.
+SHOP_METRICS_TOKEN = os.environ.get("SHOP_METRICS_TOKEN")
+
+SHOP_PAGE_SIZE = 24
+
+SHOP_MAX_PAGE_SIZE = 100
+
+SHOP_CART_RESERVATION_MINUTES = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -134,6 +224,9 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
 MEDIA_URL = "/media/"
 
+# Files under MEDIA_URL + "renditions/" are named by the hash of their content and never change:
+# the web server should send them with "Cache-Control: public, max-age=31536000, immutable".
+
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "static_dev"),
 ]
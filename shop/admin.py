@@ -1,9 +1,19 @@
+import datetime
+
 from django.contrib import admin
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
 from .models import *
-from django.forms import ModelChoiceField, ModelForm, ValidationError
+from django.forms import BaseInlineFormSet, ModelChoiceField, ModelForm, ValidationError
 
 from django.utils.safestring import mark_safe
-from PIL import Image
+from django.core.files.uploadedfile import UploadedFile
+from .images import ImageValidationError
+from . import export, rollups, search
+
+DASHBOARD_DAYS = 30
+MAX_DASHBOARD_DAYS = 366
 
 
 @admin.register(Slider)
@@ -11,6 +21,50 @@ class SliderAdmin(admin.ModelAdmin):
     list_display = ("title",)
 
 
+def search_index_results(queryset, search_term):
+    if not search_term:
+        return queryset, False
+    return search.filter_queryset(queryset, search_term), False
+
+
+def export_action(file_format, get_columns, iter_rows, filename):
+
+    def action(modeladmin, request, queryset):
+        return export.streaming_response(file_format, get_columns(queryset.model), iter_rows(queryset), filename)
+
+    action.__name__ = f"export_{file_format}"
+    action.short_description = f"Экспортировать выбранные в {file_format.upper()}"
+    return action
+
+
+CATALOGUE_EXPORT_ACTIONS = [
+    export_action(file_format, export.get_catalogue_columns, export.iter_catalogue_rows, "catalogue")
+    for file_format in export.FORMATS
+]
+ORDER_EXPORT_ACTIONS = [
+    export_action(file_format, lambda model: export.ORDER_COLUMNS, export.iter_order_rows, "orders")
+    for file_format in export.FORMATS
+]
+
+
+class StockFormSet(BaseInlineFormSet):
+
+    def save_existing(self, form, instance, commit=True):
+        # reserved moves with every checkout, writing back the value the form was rendered with would undo them
+        stock = form.save(commit=False)
+        if commit:
+            stock.save(update_fields=["on_hand"])
+        return stock
+
+
+class StockInline(admin.StackedInline):
+    model = Stock
+    formset = StockFormSet
+    fields = ("on_hand", "reserved")
+    readonly_fields = ("reserved",)
+    can_delete = False
+
+
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ["name", "slug"]
     search_fields = ["name"]
@@ -36,10 +90,6 @@ class LightMotorAdminForm(ModelForm):
             self.cleaned_data["year_of_issue"] = None
         return self.cleaned_data
 
-    MIN_RESOLUTION = (400, 400)
-    MAX_RESOLUTION = (800, 800)
-    MAX_IMAGE_SIZE = 3145728
-
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields["image"].help_text = mark_safe(
@@ -49,21 +99,18 @@ class LightMotorAdminForm(ModelForm):
 
     def clean_image(self):
         image = self.cleaned_data["image"]
-        img = Image.open(image)
-        min_height, min_width = Product.MIN_RESOLUTION
-        max_height, max_width = Product.MAX_RESOLUTION
-        if image.size > Product.MAX_IMAGE_SIZE:
-            raise ValidationError("Размер загружаемого файла не должен превышать 3 МВ!")
-        if img.height < min_height or img.width < min_width:
-            raise ValidationError("Разрешение изображения меньше минимального!")
-        if img.height > max_height or img.width > max_width:
-            raise ValidationError("Разрешение изображения больше максимального!")
+        if isinstance(image, UploadedFile):
+            try:
+                Product.validate_image(image)
+            except ImageValidationError as e:
+                raise ValidationError(str(e))
         return image
 
 
 class LightMotorAdmin(admin.ModelAdmin):
     form = LightMotorAdminForm
     change_form_template = "admin/admin.html"
+    list_select_related = ("category",)
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field == "category":
@@ -73,8 +120,12 @@ class LightMotorAdmin(admin.ModelAdmin):
     list_display = ("vendor_code", "image", "composition", "viscosity", "product_group", "classification",
                     "volume", "price", "available")
     list_filter = ["category", "vendor_code", "composition", "viscosity", "product_group", "volume", "price"]
-    search_fields = ["vendor_code", "category", "composition", "viscosity", "product_group", "volume", "price",
-                     "available"]
+    search_fields = ["vendor_code", "title"]
+    actions = CATALOGUE_EXPORT_ACTIONS
+    inlines = [StockInline]
+
+    def get_search_results(self, request, queryset, search_term):
+        return search_index_results(queryset, search_term)
 
 
 class CommercialVehiclesAdmin(admin.ModelAdmin):
@@ -88,14 +139,90 @@ class CommercialVehiclesAdmin(admin.ModelAdmin):
                     "volume", "price", "available")
     list_filter = ["category", "vendor_code", "viscosity", "product_group", "volume", "price"]
 
-    search_fields = ["composition"]
+    search_fields = ["vendor_code", "title"]
+    actions = CATALOGUE_EXPORT_ACTIONS
+    inlines = [StockInline]
+
+    def get_search_results(self, request, queryset, search_term):
+        return search_index_results(queryset, search_term)
+
+
+class OrderLineInline(admin.TabularInline):
+    model = OrderLine
+    fields = ("vendor_code", "title", "price", "quantity", "total_price")
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ("id", "first_name", "last_name", "status", "buying_type", "created_at")
+    list_filter = ["status", "buying_type"]
+    date_hierarchy = "created_at"
+    actions = ORDER_EXPORT_ACTIONS
+    inlines = [OrderLineInline]
+
+
+class RollupAdmin(admin.ModelAdmin):
+    date_hierarchy = "date"
+    list_filter = ["status", "buying_type"]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DailySales)
+class DailySalesAdmin(RollupAdmin):
+    list_display = ("date", "status", "buying_type", "units", "revenue", "orders")
+
+    def get_urls(self):
+        return [
+            path("dashboard/", self.admin_site.admin_view(self.dashboard_view), name="shop_sales_dashboard"),
+        ] + super().get_urls()
+
+    def dashboard_view(self, request):
+        try:
+            days = min(max(int(request.GET.get("days", DASHBOARD_DAYS)), 1), MAX_DASHBOARD_DAYS)
+        except ValueError:
+            days = DASHBOARD_DAYS
+        date_to = timezone.localdate()
+        date_from = date_to - datetime.timedelta(days=days - 1)
+        context = {
+            **self.admin_site.each_context(request),
+            **rollups.get_dashboard(date_from, date_to),
+            "title": "Продажи",
+            "opts": self.model._meta,
+            "date_from": date_from,
+            "date_to": date_to,
+        }
+        return TemplateResponse(request, "admin/shop/sales_dashboard.html", context)
+
+
+@admin.register(DailyProductSales)
+class DailyProductSalesAdmin(RollupAdmin):
+    list_display = ("date", "vendor_code", "title", "status", "buying_type", "units", "revenue", "orders")
+    search_fields = ["vendor_code"]
+
+
+@admin.register(DailyCategorySales)
+class DailyCategorySalesAdmin(RollupAdmin):
+    list_display = ("date", "category", "status", "buying_type", "units", "revenue", "orders")
 
 
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(CommercialVehicles, CommercialVehiclesAdmin)
 admin.site.register(LightMotor, LightMotorAdmin)
-admin.site.register(ProductCart)
-admin.site.register(Cart)
-admin.site.register(Customer)
+admin.site.register(ProductCart, list_select_related=("product",))
+admin.site.register(Cart, list_select_related=("owner__user",))
+admin.site.register(Customer, list_select_related=("user",))
 admin.site.register(Review)
-admin.site.register(Order)
+admin.site.register(Order, OrderAdmin)
@@ -0,0 +1,133 @@
+from django.db import models
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from rest_framework import serializers
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import cache
+from .models import Category, CommercialVehicles, LightMotor
+from .pagecache import PageCache, get_etag
+from .pagination import ORDERINGS, InvalidCursor, paginate
+
+CATEGORY_ORDERINGS = {
+    "name": "name",
+}
+
+
+class ValuesSerializer(serializers.ModelSerializer):
+    """
+    Serializes rows of QuerySet.values() rather than model instances: foreign keys stay ids and files stay
+    storage names. `fields` narrows the output, and the view selects only the columns that are left.
+    """
+    serializer_field_mapping = {
+        **serializers.ModelSerializer.serializer_field_mapping,
+        models.FileField: serializers.CharField,
+        models.ImageField: serializers.CharField,
+    }
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            unknown = set(fields) - set(self.fields)
+            if unknown:
+                raise ParseError(f"Unknown fields: {', '.join(sorted(unknown))}")
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def build_relational_field(self, field_name, relation_info):
+        return serializers.IntegerField, {"read_only": True}
+
+    def get_columns(self):
+        return [field.source for field in self.fields.values()]
+
+
+class CategorySerializer(ValuesSerializer):
+
+    class Meta:
+        model = Category
+        fields = ("id", "name", "slug")
+
+
+class LightMotorSerializer(ValuesSerializer):
+
+    class Meta:
+        model = LightMotor
+        exclude = ("content_type",)
+
+
+class CommercialVehiclesSerializer(ValuesSerializer):
+
+    class Meta:
+        model = CommercialVehicles
+        exclude = ("content_type",)
+
+
+class ResourceView(APIView):
+    """
+    Read-only list and detail endpoints. Lists are keyset-paginated like the category pages, and both
+    carry an ETag derived from the model's cache version, so unchanged resources are answered with 304.
+    """
+    authentication_classes = ()
+    permission_classes = ()
+    serializer_class = None
+    orderings = ORDERINGS
+    default_ordering = "created"
+    lookup_field = "slug"
+
+    @property
+    def model(self):
+        return self.serializer_class.Meta.model
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.request.query_params.get("fields")
+        if fields:
+            kwargs["fields"] = [name for name in fields.split(",") if name]
+        return self.serializer_class(*args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        etag = get_etag(self.model._meta.label_lower, request, cache.get_versions(self.model))
+        last_modified = int(cache.get_last_modified(self.model))
+        response = get_conditional_response(request, etag, last_modified)
+        if response is None:
+            lookup = kwargs.get(self.lookup_field)
+            response = Response(self.retrieve(lookup) if lookup else self.list())
+        PageCache.add_headers(response, etag, last_modified)
+        patch_vary_headers(response, ("Accept",))
+        return response
+
+    def retrieve(self, lookup):
+        serializer = self.get_serializer()
+        row = self.model.objects.filter(**{self.lookup_field: lookup}).values(*serializer.get_columns()).first()
+        if row is None:
+            raise NotFound
+        return serializer.to_representation(row)
+
+    def list(self):
+        params = self.request.query_params
+        ordering = params.get("order", self.default_ordering)
+        if ordering not in self.orderings:
+            raise ParseError("Unknown ordering")
+        serializer = self.get_serializer(many=True)
+        columns = dict.fromkeys(serializer.child.get_columns() + ["id", self.orderings[ordering].lstrip("-")])
+        try:
+            per_page = int(params["limit"]) if "limit" in params else None
+            page = paginate(self.model.objects.values(*columns), ordering, params.get("cursor"), per_page,
+                            self.orderings)
+        except (InvalidCursor, ValueError):
+            raise ParseError("Invalid cursor")
+        return {"results": serializer.to_representation(page.items), "next": page.next_cursor}
+
+
+class CategoryResourceView(ResourceView):
+    serializer_class = CategorySerializer
+    orderings = CATEGORY_ORDERINGS
+    default_ordering = "name"
+
+
+class LightMotorResourceView(ResourceView):
+    serializer_class = LightMotorSerializer
+
+
+class CommercialVehiclesResourceView(ResourceView):
+    serializer_class = CommercialVehiclesSerializer
@@ -5,3 +5,5 @@ class ShopConfig(AppConfig):
     name = "shop"
     verbose_name = "Home page"
 
+    def ready(self):
+        from . import signals
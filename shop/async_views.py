@@ -0,0 +1,155 @@
+import asyncio
+import functools
+
+from django.contrib import messages
+from django.http import Http404, HttpResponseRedirect
+from django.shortcuts import render
+from django.utils.decorators import method_decorator
+from django.views.generic import View
+
+from . import cache, facets, registry, stock
+from . import cart as cart_service
+from .executor import run_sync
+from .mixins import CategoryDetailMixin
+from .models import Category, LightMotor, Product, Slider
+from .pagecache import anonymous_page
+from .views import CATALOGUE_MODELS, INVALID_QUANTITY_MESSAGE, OUT_OF_STOCK_MESSAGE, parse_quantity
+
+
+class AsyncView(View):
+    """
+    Class-based view with async handlers. Django 3.1 only runs a view natively on the event loop when
+    as_view() returns a coroutine function, so the plain view function is wrapped into one.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            return await view(request, *args, **kwargs)
+
+        functools.update_wrapper(async_view, view)
+        return async_view
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.cart = request.cart
+        handler = self.http_method_not_allowed
+        if request.method.lower() in self.http_method_names:
+            handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+        response = handler(request, *args, **kwargs)
+        if asyncio.iscoroutine(response):
+            response = await response
+        return response
+
+
+def load_cart(request):
+    # forces the lazy cart of a signed-in customer so templates can read it without queries
+    return request.cart.total_products
+
+
+def get_facet_counts(model, selected_facets, category):
+    return facets.get_facet_counts(model, selected_facets, category) if model else []
+
+
+async def get_product(slug):
+    try:
+        return await run_sync(Product.objects.only("id", "price").get, slug=slug)
+    except Product.DoesNotExist:
+        raise Http404("Product not found")
+
+
+@method_decorator(anonymous_page("index", CATALOGUE_MODELS + (Slider,)), name="get")
+class AsyncIndexView(AsyncView):
+
+    async def get(self, request, *args, **kwargs):
+        categories, products, _ = await asyncio.gather(
+            run_sync(cache.get_categories_for_left_sidebar),
+            run_sync(cache.get_products_for_main_page),
+            run_sync(load_cart, request),
+        )
+        context = {
+            "categories": categories,
+            "products": products,
+        }
+        return await run_sync(render, request, "shop/index.html", context)
+
+
+@method_decorator(anonymous_page("category", CATALOGUE_MODELS), name="get")
+class AsyncCategoryDetailView(AsyncView, CategoryDetailMixin):
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            category = await run_sync(Category.objects.get, slug=kwargs.get("slug"))
+        except Category.DoesNotExist:
+            raise Http404("Category not found")
+        selected_facets = facets.get_selected_facets(request.GET)
+        products = facets.filter_products(self.get_category_products(category), selected_facets)
+        model = registry.get_category_model(category.slug)
+        page, facet_counts, categories, _ = await asyncio.gather(
+            run_sync(self.get_page, request, products),
+            run_sync(get_facet_counts, model, selected_facets, category),
+            run_sync(cache.get_categories_for_left_sidebar),
+            run_sync(load_cart, request),
+        )
+        context = {
+            "category": category,
+            "categories": categories,
+            "category_products": page.items,
+            "page": page,
+            "facets": facet_counts,
+        }
+        return await run_sync(render, request, "shop/category_detail.html", context)
+
+
+class AsyncProductDetailView(AsyncView, CategoryDetailMixin):
+
+    async def get(self, request, *args, **kwargs):
+        page, _ = await asyncio.gather(
+            run_sync(self.get_page, request, LightMotor.objects.select_related("category"), "title"),
+            run_sync(load_cart, request),
+        )
+        context = {
+            "products": page.items,
+            "page": page,
+        }
+        return await run_sync(render, request, "shop/product_detail.html", context)
+
+
+class AsyncAddToCartView(AsyncView):
+
+    async def get(self, request, *args, **kwargs):
+        product, _ = await asyncio.gather(get_product(kwargs.get("slug")), run_sync(load_cart, request))
+        try:
+            await run_sync(cart_service.add_product, self.cart, product)
+        except stock.OutOfStock:
+            messages.add_message(request, messages.INFO, OUT_OF_STOCK_MESSAGE)
+            return HttpResponseRedirect("/shop/cart/")
+        messages.add_message(request, messages.INFO, "Товар успешно добавлен.")
+        return HttpResponseRedirect("/shop/cart/")
+
+
+class AsyncDeleteFromCartView(AsyncView):
+
+    async def get(self, request, *args, **kwargs):
+        product, _ = await asyncio.gather(get_product(kwargs.get("slug")), run_sync(load_cart, request))
+        await run_sync(cart_service.remove_product, self.cart, product)
+        messages.add_message(request, messages.INFO, "Товар успешно удален.")
+        return HttpResponseRedirect("/shop/cart/")
+
+
+class AsyncChangeQuantityView(AsyncView):
+
+    async def post(self, request, *args, **kwargs):
+        quantity = parse_quantity(request.POST.get("quantity"))
+        if quantity is None:
+            messages.add_message(request, messages.INFO, INVALID_QUANTITY_MESSAGE)
+            return HttpResponseRedirect("/shop/cart/")
+        product, _ = await asyncio.gather(get_product(kwargs.get("slug")), run_sync(load_cart, request))
+        try:
+            await run_sync(cart_service.change_quantity, self.cart, product, quantity)
+        except stock.OutOfStock:
+            messages.add_message(request, messages.INFO, OUT_OF_STOCK_MESSAGE)
+            return HttpResponseRedirect("/shop/cart/")
+        messages.add_message(request, messages.INFO, "Кол-во успешно изменено.")
+        return HttpResponseRedirect("/shop/cart/")
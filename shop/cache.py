@@ -0,0 +1,72 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = "shop:version:{}"
+MODIFIED_KEY = "shop:modified:{}"
+CACHE_KEY = "shop:{}:{}"
+
+
+def version_key(model):
+    return VERSION_KEY.format(model._meta.label_lower)
+
+
+def get_versions(*models):
+    keys = [version_key(model) for model in models]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(model):
+    key = version_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+    cache.set(MODIFIED_KEY.format(model._meta.label_lower), time.time(), None)
+
+
+def get_last_modified(*models):
+    keys = [MODIFIED_KEY.format(model._meta.label_lower) for model in models]
+    timestamps = cache.get_many(keys)
+    for key in keys:
+        if key not in timestamps:
+            cache.add(key, time.time(), None)
+            timestamps[key] = cache.get(key)
+    return max(timestamps.values())
+
+
+def get_or_build(name, models, builder, timeout=None):
+    key = CACHE_KEY.format(name, ".".join(str(version) for version in get_versions(*models)))
+    value = cache.get(key)
+    if value is None:
+        value = builder()
+        if timeout is None:
+            timeout = getattr(settings, "SHOP_CACHE_TIMEOUT", 60 * 15)
+        cache.set(key, value, timeout)
+    return value
+
+
+def get_categories_for_left_sidebar():
+    from .models import Category, CommercialVehicles, LightMotor
+
+    return get_or_build(
+        "sidebar", (Category, LightMotor, CommercialVehicles), Category.objects.get_categories_for_left_sidebar
+    )
+
+
+def get_products_for_main_page():
+    from .models import Category, CommercialVehicles, LatestProducts, LightMotor
+
+    return get_or_build(
+        "main_page_products",
+        (Category, LightMotor, CommercialVehicles),
+        lambda: LatestProducts.objects.get_products_for_main_page(
+            "light_motors", "commercial_vehicles", with_respect_to="light_motors"
+        )
+    )
@@ -0,0 +1,264 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import registry, stock
+from .models import Cart, Customer, OrderLine, Product, ProductCart
+
+
+MIN_QUANTITY = 1
+
+
+def check_quantity(quantity):
+    if quantity < MIN_QUANTITY:
+        raise ValueError(f"Quantity must be at least {MIN_QUANTITY}, got {quantity}")
+
+
+class CartLine:
+    __slots__ = ("product", "quantity", "total_price")
+
+    def __init__(self, product, quantity, total_price):
+        self.product = product
+        self.quantity = quantity
+        self.total_price = total_price
+
+
+class SessionCartLines:
+
+    def __init__(self, cart):
+        self.cart = cart
+
+    def count(self):
+        return len(self.cart.lines)
+
+    def all(self):
+        return get_lines(self.cart)
+
+
+class SessionCart:
+    SESSION_KEY = "shop_cart"
+
+    owner = None
+    in_order = False
+    for_anonymous_user = True
+
+    def __init__(self, session):
+        self.session = session
+        self.product = SessionCartLines(self)
+
+    @property
+    def lines(self):
+        return self.session.get(self.SESSION_KEY, {})
+
+    @property
+    def total_products(self):
+        return len(self.lines)
+
+    @property
+    def total_price(self):
+        return sum((Decimal(price) * quantity for quantity, price in self.lines.values()), Decimal(0))
+
+    def save_lines(self, lines):
+        if lines:
+            self.session[self.SESSION_KEY] = lines
+        else:
+            self.session.pop(self.SESSION_KEY, None)
+
+    def clear(self):
+        self.save_lines({})
+
+
+class DatabaseCartBackend:
+
+    @staticmethod
+    def lock_cart(cart):
+        Cart.objects.filter(pk=cart.pk).update(updated=timezone.now())
+
+    @staticmethod
+    def update_totals(cart, price_delta, products_delta):
+        Cart.objects.filter(pk=cart.pk).update(
+            total_price=F("total_price") + price_delta,
+            total_products=F("total_products") + products_delta
+        )
+        cart.total_price += price_delta
+        cart.total_products += products_delta
+
+    @transaction.atomic
+    def add_product(self, cart, product, quantity=1):
+        check_quantity(quantity)
+        self.lock_cart(cart)
+        stock.reserve(product.pk, quantity)
+        price_delta = product.price * quantity
+        updated = ProductCart.objects.filter(cart=cart, product_id=product.pk).update(
+            quantity=F("quantity") + quantity, reserved=F("reserved") + quantity,
+            total_price=F("total_price") + price_delta
+        )
+        products_delta = 0
+        if not updated:
+            product_cart = ProductCart.objects.create(user=cart.owner, cart=cart, product=product, quantity=quantity,
+                                                      reserved=quantity)
+            cart.product.add(product_cart)
+            products_delta = 1
+        self.update_totals(cart, price_delta, products_delta)
+        return not updated
+
+    @transaction.atomic
+    def change_quantity(self, cart, product, quantity):
+        check_quantity(quantity)
+        self.lock_cart(cart)
+        product_cart = ProductCart.objects.filter(cart=cart, product_id=product.pk).values(
+            "pk", "reserved", "total_price"
+        ).first()
+        if product_cart is None:
+            return False
+        # also tops up a reservation that was released while the cart sat abandoned
+        if quantity > product_cart["reserved"]:
+            stock.reserve(product.pk, quantity - product_cart["reserved"])
+        else:
+            stock.release(product.pk, product_cart["reserved"] - quantity)
+        total_price = product.price * quantity
+        ProductCart.objects.filter(pk=product_cart["pk"]).update(
+            quantity=quantity, reserved=quantity, total_price=total_price
+        )
+        self.update_totals(cart, total_price - product_cart["total_price"], 0)
+        return True
+
+    @transaction.atomic
+    def remove_product(self, cart, product):
+        self.lock_cart(cart)
+        product_cart = ProductCart.objects.filter(cart=cart, product_id=product.pk).values(
+            "pk", "reserved", "total_price"
+        ).first()
+        if product_cart is None:
+            return False
+        stock.release(product.pk, product_cart["reserved"])
+        cart.product.remove(product_cart["pk"])
+        ProductCart.objects.filter(pk=product_cart["pk"]).delete()
+        self.update_totals(cart, -product_cart["total_price"], -1)
+        return True
+
+
+class SessionCartBackend:
+
+    def add_product(self, cart, product, quantity=1):
+        check_quantity(quantity)
+        lines = cart.lines
+        pk = str(product.pk)
+        created = pk not in lines
+        current_quantity = 0 if created else lines[pk][0]
+        lines[pk] = [current_quantity + quantity, str(product.price)]
+        cart.save_lines(lines)
+        return created
+
+    def change_quantity(self, cart, product, quantity):
+        check_quantity(quantity)
+        lines = cart.lines
+        pk = str(product.pk)
+        if pk not in lines:
+            return False
+        lines[pk] = [quantity, str(product.price)]
+        cart.save_lines(lines)
+        return True
+
+    def remove_product(self, cart, product):
+        lines = cart.lines
+        if lines.pop(str(product.pk), None) is None:
+            return False
+        cart.save_lines(lines)
+        return True
+
+
+database_backend = DatabaseCartBackend()
+session_backend = SessionCartBackend()
+
+
+def get_backend(cart):
+    if isinstance(cart, SessionCart):
+        return session_backend
+    return database_backend
+
+
+def add_product(cart, product, quantity=1):
+    return get_backend(cart).add_product(cart, product, quantity)
+
+
+def change_quantity(cart, product, quantity):
+    return get_backend(cart).change_quantity(cart, product, quantity)
+
+
+def remove_product(cart, product):
+    return get_backend(cart).remove_product(cart, product)
+
+
+def get_lines(cart):
+    """Cart lines with their products resolved to the concrete product types, one query per type."""
+    if isinstance(cart, SessionCart):
+        lines = [(int(pk), quantity, Decimal(price) * quantity) for pk, (quantity, price) in cart.lines.items()]
+        keys = Product.objects.filter(pk__in=[pk for pk, _, _ in lines]).values_list("pk", "content_type_id")
+    else:
+        lines = list(ProductCart.objects.filter(cart=cart).order_by("pk").values_list(
+            "product_id", "product__content_type_id", "quantity", "total_price"
+        ))
+        keys = [(product_id, content_type_id) for product_id, content_type_id, _, _ in lines]
+        lines = [(product_id, quantity, total_price) for product_id, _, quantity, total_price in lines]
+    products = registry.load_products(keys)
+    return [
+        CartLine(products[product_id], quantity, total_price)
+        for product_id, quantity, total_price in lines if product_id in products
+    ]
+
+
+def get_customer_cart(user):
+    cart = Cart.objects.select_related("owner").filter(owner__user=user, in_order=False).first()
+    if cart:
+        cart.owner.user = user
+        return cart
+    customer = Customer.objects.filter(user=user).first()
+    if not customer:
+        customer = Customer.objects.create(user=user)
+    return Cart.objects.create(owner=customer)
+
+
+def merge_session_cart(session, user):
+    session_cart = SessionCart(session)
+    lines = session_cart.lines
+    if not lines:
+        return None
+    cart = get_customer_cart(user)
+    products = Product.objects.only("id", "price").in_bulk([int(pk) for pk in lines])
+    with transaction.atomic():
+        for pk, (quantity, _) in lines.items():
+            # sessions written before quantities were checked may still hold zero or negative lines
+            if int(pk) in products and quantity >= MIN_QUANTITY:
+                try:
+                    database_backend.add_product(cart, products[int(pk)], quantity)
+                except stock.OutOfStock:
+                    # anonymous carts hold no reservations, so the stock may be gone by the time they sign in
+                    continue
+    session_cart.clear()
+    return cart
+
+
+def lock_for_checkout(cart_id):
+    """Locks the cart for the checkout transaction; False if another request has already ordered it."""
+    return bool(Cart.objects.filter(pk=cart_id, in_order=False).update(updated=timezone.now()))
+
+
+def get_unit_price(total_price, quantity):
+    if not quantity:
+        return total_price
+    return (total_price / quantity).quantize(Decimal("0.01"))
+
+
+def snapshot_order_lines(order, cart):
+    lines = ProductCart.objects.filter(cart=cart).order_by("pk").values_list(
+        "product_id", "product__category_id", "product__vendor_code", "product__title", "quantity", "total_price"
+    )
+    return OrderLine.objects.bulk_create([
+        OrderLine(order=order, product_id=product_id, category_id=category_id, vendor_code=vendor_code,
+                  title=title, price=get_unit_price(total_price, quantity), quantity=quantity,
+                  total_price=total_price)
+        for product_id, category_id, vendor_code, title, quantity, total_price in lines
+    ])
@@ -0,0 +1,106 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_MODELS = {
+    "shop.category", "shop.product", "shop.lightmotor", "shop.commercialvehicles", "shop.productfacet",
+    "shop.productsearchdocument", "shop.searchterm", "shop.slider", "shop.review",
+}
+PIN_COOKIE = "shop_primary"
+# stored in the database file itself, so test databases keep SQLite's default
+FILE_PRAGMAS = {"journal_mode"}
+
+
+class ReplicaState:
+    """Per-request flags, shared with the executor threads of async views, which run on copied contexts."""
+    __slots__ = ("pinned", "written")
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.written = False
+
+
+_state = ContextVar("shop_replica_state", default=None)
+
+
+def get_replicas():
+    return [alias for alias in getattr(settings, "SHOP_READ_REPLICAS", ()) if alias in settings.DATABASES]
+
+
+def begin_request(pinned=False):
+    return _state.set(ReplicaState(pinned))
+
+
+def end_request(token):
+    """Returns whether the request wrote catalogue data, and so whether its client should stay pinned."""
+    state = _state.get()
+    _state.reset(token)
+    return state is not None and state.written
+
+
+def is_pinned():
+    state = _state.get()
+    return state is not None and (state.pinned or state.written)
+
+
+class CatalogueRouter:
+    """
+    Sends catalogue reads to a read replica. Everything else stays on the primary: all writes, reads
+    inside a transaction on the primary, and reads of a request or client that has just written catalogue
+    data (see ReplicaPinningMiddleware), so nobody reads past their own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower not in REPLICA_MODELS:
+            return None
+        replicas = get_replicas()
+        if not replicas or is_pinned() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and model._meta.label_lower in REPLICA_MODELS:
+            state.written = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replicas():
+            return False
+        return None
+
+
+def is_test_database(connection):
+    test = connection.settings_dict.get("TEST", {})
+    if test.get("MIRROR"):
+        test = connections[test["MIRROR"]].settings_dict.get("TEST", {})
+    return test.get("NAME") is not None and str(connection.settings_dict["NAME"]) == str(test["NAME"])
+
+
+def apply_pragmas(connection):
+    pragmas = connection.settings_dict.get("PRAGMAS")
+    if connection.vendor != "sqlite" or not pragmas:
+        return
+    test_database = is_test_database(connection)
+    for name, value in pragmas.items():
+        if not (test_database and name in FILE_PRAGMAS):
+            connection.connection.execute(f"PRAGMA {name} = {value}")
+
+
+def check_connections():
+    if not getattr(settings, "SHOP_DB_HEALTH_CHECKS", False):
+        return
+    for connection in connections.all():
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
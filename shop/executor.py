@@ -0,0 +1,50 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections
+
+from . import profiling
+
+DEFAULT_WORKERS = 8
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "SHOP_ASYNC_DB_WORKERS", DEFAULT_WORKERS), thread_name_prefix="shop-db"
+            )
+        return _executor
+
+
+def close_old_connections():
+    # what request_started/request_finished do for sync views; executor threads never see those signals
+    for connection in connections.all():
+        connection.close_if_unusable_or_obsolete()
+
+
+def call(func, args, kwargs):
+    close_old_connections()
+    try:
+        with profiling.capture_queries():
+            return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def run_sync(func, *args, **kwargs):
+    """
+    Runs blocking ORM code on the bounded executor. Unlike sync_to_async(thread_sensitive=True), calls
+    from one request can run in parallel. Each worker thread has its own connection, which is recycled
+    around every call the way a request recycles it: it stays open for up to CONN_MAX_AGE seconds, or is
+    closed after each call when CONN_MAX_AGE is 0. The pool size caps the number of open connections.
+    """
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(get_executor(), context.run, call, func, args, kwargs)
@@ -0,0 +1,95 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .importer import batched
+from .models import Order, OrderLine
+
+FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+}
+DEFAULT_CHUNK_SIZE = 500
+
+ORDER_FIELDS = (
+    "id", "created_at", "status", "buying_type", "first_name", "last_name", "phone", "address", "order_data",
+)
+LINE_FIELDS = ("product_id", "vendor_code", "title", "price", "quantity", "total_price")
+ORDER_COLUMNS = ("order_id",) + ORDER_FIELDS[1:] + LINE_FIELDS
+CATALOGUE_FIELDS = ("vendor_code", "title", "slug", "description", "price", "available", "image")
+
+
+class Echo:
+
+    def write(self, value):
+        return value
+
+
+def render_csv(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([row[column] for column in columns])
+
+
+def render_jsonl(columns, rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode({column: row[column] for column in columns}) + "\n"
+
+
+RENDERERS = {
+    "csv": render_csv,
+    "jsonl": render_jsonl,
+}
+
+
+def filter_orders(queryset, date_from=None, date_to=None):
+    if date_from:
+        queryset = queryset.filter(created_at__date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(created_at__date__lte=date_to)
+    return queryset
+
+
+def iter_order_rows(queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """One row per order line: a query for each chunk of orders and one for their line snapshots."""
+    if queryset is None:
+        queryset = Order.objects.all()
+    orders = queryset.order_by("pk").values(*ORDER_FIELDS).iterator(chunk_size=chunk_size)
+    empty_line = dict.fromkeys(LINE_FIELDS)
+    for chunk in batched(orders, chunk_size):
+        lines = {}
+        for line in OrderLine.objects.filter(order_id__in=[order["id"] for order in chunk]).values(
+            "order_id", *LINE_FIELDS
+        ):
+            lines.setdefault(line.pop("order_id"), []).append(line)
+        for order in chunk:
+            order["order_id"] = order.pop("id")
+            for line in lines.get(order["order_id"]) or [empty_line]:
+                yield {**order, **line}
+
+
+def get_catalogue_columns(model):
+    child_fields = [field.name for field in model._meta.local_concrete_fields if not field.primary_key]
+    return CATALOGUE_FIELDS + ("category",) + tuple(child_fields)
+
+
+def iter_catalogue_rows(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    columns = get_catalogue_columns(queryset.model)
+    fields = [column for column in columns if column != "category"]
+    for row in queryset.order_by("pk").values(*fields, "category__slug").iterator(chunk_size=chunk_size):
+        row["category"] = row.pop("category__slug")
+        yield row
+
+
+def render(file_format, columns, rows):
+    return RENDERERS[file_format](columns, rows)
+
+
+def streaming_response(file_format, columns, rows, filename):
+    response = StreamingHttpResponse(render(file_format, columns, rows), content_type=FORMATS[file_format])
+    response["Content-Disposition"] = f'attachment; filename="{filename}.{file_format}"'
+    return response
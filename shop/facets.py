@@ -0,0 +1,74 @@
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import ProductFacet
+
+FACET_FIELDS = {
+    "product_group": "Группа продукта",
+    "composition": "Состав продукта",
+    "viscosity": "Вязкость продукта",
+    "volume": "Объем",
+    "classification": "Классификация продукта",
+}
+
+
+def get_selected_facets(query):
+    selected = {}
+    for facet in FACET_FIELDS:
+        values = [value for value in query.getlist(facet) if value]
+        if values:
+            selected[facet] = values
+    return selected
+
+
+def get_facet_products(facet, values):
+    return ProductFacet.objects.filter(facet=facet, value__in=values).values("product_id")
+
+
+def filter_products(queryset, selected):
+    for facet, values in selected.items():
+        queryset = queryset.filter(pk__in=get_facet_products(facet, values))
+    return queryset
+
+
+def get_facet_counts(model, selected, category=None):
+    facets = ProductFacet.objects.filter(model_name=model._meta.model_name, product__available=True)
+    if category is not None:
+        facets = facets.filter(product__category=category)
+    for facet, values in selected.items():
+        facets = facets.filter(Q(facet=facet) | Q(product_id__in=get_facet_products(facet, values)))
+    counts = {facet: [] for facet in FACET_FIELDS}
+    rows = facets.values_list("facet", "value").annotate(count=Count("product_id")).order_by("facet", "value")
+    for facet, value, count in rows:
+        counts[facet].append((value, count, value in selected.get(facet, ())))
+    return [(facet, name, counts[facet]) for facet, name in FACET_FIELDS.items() if counts[facet]]
+
+
+def get_facet_rows(product):
+    model_name = product._meta.model_name
+    return [
+        ProductFacet(product_id=product.pk, model_name=model_name, facet=facet, value=getattr(product, facet))
+        for facet in FACET_FIELDS if getattr(product, facet, "")
+    ]
+
+
+def index_product(product):
+    index_products([product])
+
+
+@transaction.atomic
+def index_products(products):
+    ProductFacet.objects.filter(product_id__in=[product.pk for product in products]).delete()
+    ProductFacet.objects.bulk_create([row for product in products for row in get_facet_rows(product)])
+
+
+@transaction.atomic
+def rebuild_index(model, batch_size=1000):
+    ProductFacet.objects.filter(model_name=model._meta.model_name).delete()
+    rows = []
+    for product in model.objects.only(*FACET_FIELDS).iterator(chunk_size=batch_size):
+        rows.extend(get_facet_rows(product))
+        if len(rows) >= batch_size:
+            ProductFacet.objects.bulk_create(rows)
+            rows = []
+    ProductFacet.objects.bulk_create(rows)
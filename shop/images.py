@@ -0,0 +1,269 @@
+import hashlib
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+RENDITION_SIZES = {
+    "thumbnail": (100, 100),
+    "card": (300, 300),
+    "detail": (500, 500),
+    "slider": (1920, 1024),
+    "slider_md": (1280, 683),
+    "slider_sm": (768, 410),
+}
+RENDITION_FORMATS = {
+    "jpeg": ("JPEG", "jpg"),
+    "webp": ("WEBP", "webp"),
+}
+RENDITION_ROOT = "renditions"
+PRODUCT_RENDITIONS = ("thumbnail", "card", "detail")
+SLIDER_RENDITIONS = ("slider", "slider_md", "slider_sm")
+DEFAULT_RENDITION = ("detail", "jpeg")
+
+DEFAULT_MAX_PIXELS = 4096 * 4096
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_STALE = "stale"
+
+
+class RenditionJob:
+    __slots__ = ("id", "model", "pk", "field_name", "hash_field", "sizes", "swap", "source", "status", "result",
+                 "error", "queued_at", "started_at", "finished_at", "finished")
+
+    def __init__(self, job_id, model, pk, field_name, hash_field, sizes, swap, source):
+        self.id = job_id
+        self.model = model
+        self.pk = pk
+        self.field_name = field_name
+        self.hash_field = hash_field
+        self.sizes = sizes
+        self.swap = swap
+        self.source = source
+        self.status = JOB_QUEUED
+        self.result = None
+        self.error = None
+        self.queued_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.finished = threading.Event()
+
+    @property
+    def wait_time(self):
+        if self.started_at is None:
+            return None
+        return self.started_at - self.queued_at
+
+    @property
+    def run_time(self):
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+class ImageValidationError(ValueError):
+    pass
+
+
+class MinResolutionErrorException(ImageValidationError):
+    pass
+
+
+class MaxResolutionErrorException(ImageValidationError):
+    pass
+
+
+class MaxImageSizeErrorException(ImageValidationError):
+    pass
+
+
+class ImageInfo:
+    __slots__ = ("width", "height", "format", "size")
+
+    def __init__(self, width, height, image_format, size):
+        self.width = width
+        self.height = height
+        self.format = image_format
+        self.size = size
+
+
+def get_max_pixels():
+    return getattr(settings, "SHOP_IMAGE_MAX_PIXELS", DEFAULT_MAX_PIXELS)
+
+
+def inspect_image(file):
+    info = getattr(file, "image_info", None)
+    if info is not None:
+        return info
+    img = getattr(file, "image", None)
+    if img is None:
+        position = file.tell()
+        img = Image.open(file)
+        file.seek(position)
+    width, height = img.size
+    if width * height > get_max_pixels():
+        raise MaxResolutionErrorException("Разрешение изображения больше максимального!")
+    info = ImageInfo(width, height, img.format, getattr(file, "size", None))
+    file.image_info = info
+    return info
+
+
+def validate_image(file, min_resolution, max_resolution, max_size):
+    info = inspect_image(file)
+    min_height, min_width = min_resolution
+    max_height, max_width = max_resolution
+    if info.size is not None and info.size > max_size:
+        raise MaxImageSizeErrorException("Размер загружаемого файла не должен превышать 3 МВ!")
+    if info.height < min_height or info.width < min_width:
+        raise MinResolutionErrorException("Разрешение изображения меньше минимального!")
+    if info.height > max_height or info.width > max_width:
+        raise MaxResolutionErrorException("Разрешение изображения больше максимального!")
+    return info
+
+
+def decode(content):
+    img = Image.open(BytesIO(content))
+    width, height = img.size
+    if width * height > get_max_pixels():
+        raise MaxResolutionErrorException("Разрешение изображения больше максимального!")
+    return img.convert("RGB")
+
+
+def content_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def rendition_name(digest, size, image_format="jpeg"):
+    _, extension = RENDITION_FORMATS[image_format]
+    return "{}/{}/{}.{}".format(digest[:2], digest, size, extension)
+
+
+def rendition_path(digest, size, image_format="jpeg"):
+    return "{}/{}".format(RENDITION_ROOT, rendition_name(digest, size, image_format))
+
+
+def render(img, size, image_format="jpeg", quality=90):
+    pil_format, _ = RENDITION_FORMATS[image_format]
+    filestream = BytesIO()
+    ImageOps.fit(img, RENDITION_SIZES[size], Image.LANCZOS).save(filestream, pil_format, quality=quality)
+    return filestream.getvalue()
+
+
+def build_renditions(storage, content, sizes):
+    digest = content_hash(content)
+    img = None
+    for size in sizes:
+        for image_format in RENDITION_FORMATS:
+            path = rendition_path(digest, size, image_format)
+            if storage.exists(path):
+                continue
+            if img is None:
+                img = decode(content)
+            name = storage.save(path, ContentFile(render(img, size, image_format)))
+            if name != path:
+                storage.delete(name)
+    return digest
+
+
+class RenditionPipeline:
+    MAX_FINISHED_JOBS = 1000
+
+    def __init__(self, workers=None):
+        self.workers = workers
+        self._executor = None
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def get_workers(self):
+        if self.workers is None:
+            return getattr(settings, "SHOP_IMAGE_WORKERS", 2)
+        return self.workers
+
+    def get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.get_workers(), thread_name_prefix="shop-images")
+            return self._executor
+
+    def submit(self, instance, field_name="image", hash_field="image_hash", sizes=PRODUCT_RENDITIONS,
+               swap=DEFAULT_RENDITION):
+        with self._lock:
+            job = RenditionJob(
+                next(self._ids), type(instance), instance.pk, field_name, hash_field, sizes, swap,
+                getattr(instance, field_name).name
+            )
+            self._jobs[job.id] = job
+            self._forget_finished()
+        if self.get_workers():
+            self.get_executor().submit(self.run, job)
+        else:
+            self.run(job)
+        return job
+
+    def run(self, job):
+        from django.db import close_old_connections
+
+        from .cache import bump_version
+
+        job.started_at = time.monotonic()
+        job.status = JOB_RUNNING
+        try:
+            field = job.model._meta.get_field(job.field_name)
+            storage = field.storage
+            with storage.open(job.source) as source:
+                content = source.read()
+            digest = build_renditions(storage, content, job.sizes)
+            values = {job.hash_field: digest}
+            name = job.source
+            if job.swap:
+                name = values[job.field_name] = rendition_path(digest, *job.swap)
+            swapped = field.model._base_manager.filter(pk=job.pk, **{job.field_name: job.source}).update(**values)
+            if swapped:
+                bump_version(job.model)
+                job.status = JOB_DONE
+                job.result = name
+            else:
+                job.status = JOB_STALE
+        except Exception as exc:
+            job.status = JOB_FAILED
+            job.error = repr(exc)
+        finally:
+            job.finished_at = time.monotonic()
+            job.finished.set()
+            if self.get_workers():
+                close_old_connections()
+        return job
+
+    def get_job(self, job_id):
+        return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        finished = [job for job in jobs if job.finished_at is not None]
+        run_times = [job.run_time for job in finished]
+        wait_times = [job.wait_time for job in jobs if job.wait_time is not None]
+        return {
+            "statuses": {status: sum(job.status == status for job in jobs)
+                         for status in (JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED, JOB_STALE)},
+            "avg_run_time": sum(run_times) / len(run_times) if run_times else None,
+            "max_run_time": max(run_times) if run_times else None,
+            "avg_wait_time": sum(wait_times) / len(wait_times) if wait_times else None,
+        }
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(len(finished) - self.MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job_id]
+
+
+pipeline = RenditionPipeline()
@@ -0,0 +1,258 @@
+import csv
+import functools
+import json
+import os
+from collections import deque
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import facets, registry, search
+from .cache import bump_version
+from .images import JOB_FAILED, pipeline
+from .models import Category, Product
+
+FORMATS = ("csv", "jsonl")
+PRODUCT_UPDATE_FIELDS = ("category", "title", "slug", "description", "price", "available")
+IMAGE_CACHE_SIZE = 1024
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+def read_rows(path, file_format=None):
+    file_format = file_format or os.path.splitext(path)[1].lstrip(".").lower()
+    if file_format not in FORMATS:
+        raise ValueError(f"Неизвестный формат файла: {file_format}")
+    with open(path, encoding="utf-8-sig", newline="") as file:
+        if file_format == "csv":
+            yield from enumerate(csv.DictReader(file), 2)
+        else:
+            for line_number, line in enumerate(file, 1):
+                if line.strip():
+                    yield line_number, line
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def get_prep_values(fields, obj):
+    return [field.get_db_prep_save(getattr(obj, field.attname), connection) for field in fields]
+
+
+def insert_rows(model, objs, fields):
+    quote_name = connection.ops.quote_name
+    columns = ", ".join(quote_name(field.column) for field in fields)
+    placeholders = ", ".join(["%s"] * len(fields))
+    sql = f"INSERT INTO {quote_name(model._meta.db_table)} ({columns}) VALUES ({placeholders})"
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [get_prep_values(fields, obj) for obj in objs])
+
+
+def update_rows(model, objs, field_names):
+    # bulk_update() builds a CASE per field over the whole batch, a prepared UPDATE per row is much cheaper
+    quote_name = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in field_names]
+    assignments = ", ".join(f"{quote_name(field.column)} = %s" for field in fields)
+    sql = f"UPDATE {quote_name(model._meta.db_table)} SET {assignments} WHERE {quote_name(model._meta.pk.column)} = %s"
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [get_prep_values(fields, obj) + [obj.pk] for obj in objs])
+
+
+class ImportStats:
+    __slots__ = ("rows", "created", "updated", "skipped", "images", "images_failed")
+
+    def __init__(self):
+        self.rows = self.created = self.updated = self.skipped = self.images = self.images_failed = 0
+
+
+class CatalogueImporter:
+    """
+    Upserts products by vendor_code in batches. New parent rows go through bulk_create() on Product and
+    their child rows through one prepared INSERT (bulk_create() refuses multi-table inherited models).
+    Existing products get prepared UPDATEs of only the columns their row carries.
+    """
+
+    def __init__(self, model, batch_size=500, image_root=None, image_pipeline=None, max_pending_images=None,
+                 on_error=None):
+        self.model = model
+        self.batch_size = batch_size
+        self.image_root = image_root
+        self.pipeline = image_pipeline or pipeline
+        self.max_pending_images = max_pending_images or batch_size * 2
+        self.on_error = on_error
+        self.categories = dict(Category.objects.values_list("slug", "pk"))
+        self.default_category = Category.categories.get(model.__name__)
+        self.content_type = registry.get_content_type(model)
+        self.fields = [
+            field for field in model._meta.concrete_fields
+            if field.editable and not field.primary_key and not field.is_relation and field.name != "image"
+        ]
+        self.child_fields = [field.name for field in model._meta.local_concrete_fields if not field.primary_key]
+        self.image_field = model._meta.get_field("image")
+        self.store_image = functools.lru_cache(maxsize=IMAGE_CACHE_SIZE)(self._store_image)
+        self.pending_images = deque()
+        self.stats = ImportStats()
+
+    def error(self, line_number, message):
+        self.stats.skipped += 1
+        if self.on_error is not None:
+            self.on_error(line_number, message)
+
+    def _store_image(self, path):
+        storage = self.image_field.storage
+        if not self.image_root and not os.path.isabs(path) and storage.exists(path):
+            return path
+        if self.image_root:
+            path = os.path.join(self.image_root, path)
+        with open(path, "rb") as file:
+            name = self.image_field.generate_filename(None, os.path.basename(path))
+            return storage.save(name, File(file))
+
+    def build_product(self, row):
+        if isinstance(row, str):
+            try:
+                row = json.loads(row)
+            except ValueError as exc:
+                raise ImportRowError(f"некорректный JSON: {exc}")
+        # a partial row updates only its own columns; a generated slug is only used for new products
+        present = {field.name for field in self.fields if field.name in row and field.name != "slug"}
+        if row.get("slug"):
+            present.add("slug")
+        else:
+            row["slug"] = slugify(f"{row.get('title', '')} {row.get('vendor_code', '')}")
+        if row.get("category"):
+            present.add("category")
+        values = {}
+        for field in self.fields:
+            value = row.get(field.name)
+            if value in (None, "") and (field.has_default() or field.blank):
+                continue
+            try:
+                values[field.attname] = field.clean(value, None)
+            except ValidationError as exc:
+                raise ImportRowError(f"{field.name}: {'; '.join(exc.messages)}")
+        category_slug = row.get("category") or self.default_category
+        if category_slug not in self.categories:
+            raise ImportRowError(f"категория {category_slug!r} не найдена")
+        product = self.model(category_id=self.categories[category_slug], content_type=self.content_type, **values)
+        product.import_fields = frozenset(present)
+        if row.get("image"):
+            try:
+                product.image = self.store_image(row["image"])
+            except OSError as exc:
+                raise ImportRowError(f"image: {exc}")
+        return product
+
+    def parse_rows(self, rows):
+        for line_number, row in rows:
+            self.stats.rows += 1
+            try:
+                yield line_number, self.build_product(row)
+            except ImportRowError as exc:
+                self.error(line_number, str(exc))
+
+    def upsert(self, items):
+        items = list({product.vendor_code: (line_number, product) for line_number, product in items}.values())
+        existing = {
+            vendor_code: (pk, child_pk, image)
+            for vendor_code, pk, child_pk, image in Product.objects.filter(
+                vendor_code__in=[product.vendor_code for _, product in items]
+            ).values_list("vendor_code", "pk", self.model._meta.model_name, "image")
+        }
+        now = timezone.now()
+        created, updated, errors = [], [], []
+        for line_number, product in items:
+            if product.vendor_code not in existing:
+                created.append(product)
+                continue
+            pk, child_pk, image = existing[product.vendor_code]
+            if child_pk is None:
+                errors.append((line_number, f"артикул {product.vendor_code} занят продуктом другого типа"))
+                continue
+            product.id = product.product_ptr_id = pk
+            product.updated = now
+            if product.image.name == image:
+                product.image = None
+            updated.append(product)
+        if created:
+            Product.objects.bulk_create([
+                Product(**{field.attname: getattr(product, field.attname) for field in Product._meta.concrete_fields})
+                for product in created
+            ])
+            ids = dict(Product.objects.filter(
+                vendor_code__in=[product.vendor_code for product in created]
+            ).values_list("vendor_code", "pk"))
+            for product in created:
+                product.id = product.product_ptr_id = ids[product.vendor_code]
+            insert_rows(self.model, created, self.model._meta.local_concrete_fields)
+        indexed = list(created)
+        if updated:
+            groups = {}
+            for product in updated:
+                groups.setdefault(product.import_fields, []).append(product)
+            for fields, group in groups.items():
+                update_rows(Product, group, [name for name in PRODUCT_UPDATE_FIELDS if name in fields] + ["updated"])
+                child_fields = [name for name in self.child_fields if name in fields]
+                if child_fields:
+                    update_rows(self.model, group, child_fields)
+            update_rows(Product, [product for product in updated if product.image], ("image", "image_hash"))
+            # the columns a row left out keep their stored values, which the indexes must see
+            indexed += self.model._base_manager.filter(pk__in=[product.pk for product in updated])
+        products = created + updated
+        facets.index_products(indexed)
+        search.index_products(indexed)
+        self.stats.created += len(created)
+        self.stats.updated += len(updated)
+        return products, errors
+
+    def import_batch(self, items):
+        with transaction.atomic():
+            try:
+                with transaction.atomic():
+                    products, errors = self.upsert(items)
+            except IntegrityError:
+                products, errors = [], []
+                for line_number, product in items:
+                    try:
+                        with transaction.atomic():
+                            row_products, row_errors = self.upsert([(line_number, product)])
+                    except IntegrityError as exc:
+                        row_products, row_errors = [], [(line_number, str(exc))]
+                    products.extend(row_products)
+                    errors.extend(row_errors)
+        for line_number, message in errors:
+            self.error(line_number, message)
+        bump_version(self.model)
+        for product in products:
+            if product.image:
+                self.submit_image(product)
+
+    def submit_image(self, product):
+        self.stats.images += 1
+        self.pending_images.append(self.pipeline.submit(product))
+        while len(self.pending_images) > self.max_pending_images:
+            self.wait_for_image(self.pending_images.popleft())
+
+    def wait_for_image(self, job):
+        job.finished.wait()
+        if job.status == JOB_FAILED:
+            self.stats.images_failed += 1
+
+    def run(self, rows):
+        for items in batched(self.parse_rows(rows), self.batch_size):
+            self.import_batch(items)
+            yield self.stats
+        while self.pending_images:
+            self.wait_for_image(self.pending_images.popleft())
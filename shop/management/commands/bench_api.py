@@ -0,0 +1,53 @@
+import time
+
+from django.test import Client
+from django.urls import reverse
+
+from shop.management.commands import bench_shop
+
+ENDPOINTS = (
+    ("api_categories", {}),
+    ("api_light_motors", {}),
+    ("api_light_motors", {"fields": "id,title,price"}),
+    ("api_light_motors", {"order": "title"}),
+    ("api_commercial_vehicles", {}),
+    ("api_commercial_vehicles", {"fields": "slug,price,available"}),
+)
+
+
+class Command(bench_shop.Command):
+    help = "Seed a synthetic catalogue in a throwaway test database and measure the throughput of the API lists"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--pages", type=int, default=20)
+        parser.add_argument("--limit", type=int, default=100)
+
+    def run(self, options):
+        bench_shop.seed_catalogue(options["products"])
+        client = Client()
+        self.stdout.write(f"{'endpoint':<72}{'pages':>7}{'rows':>8}{'req/s':>9}{'rows/s':>10}{'304/s':>9}")
+        for name, params in ENDPOINTS:
+            url = reverse(name)
+            params = {**params, "limit": options["limit"]}
+            pages, rows, cursor, etag = 0, 0, None, None
+            started = time.perf_counter()
+            while pages < options["pages"]:
+                response = client.get(url, {**params, "cursor": cursor} if cursor else params)
+                data = response.json()
+                pages += 1
+                rows += len(data["results"])
+                etag = etag or response["ETag"]
+                cursor = data["next"]
+                if cursor is None:
+                    break
+            elapsed = time.perf_counter() - started
+            started = time.perf_counter()
+            for _ in range(pages):
+                client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+            revalidated = time.perf_counter() - started
+            label = f"{url}?{'&'.join(f'{key}={value}' for key, value in params.items())}"
+            self.stdout.write(
+                f"{label:<72}{pages:>7}{rows:>8}{pages / elapsed:>9.1f}{rows / elapsed:>10.0f}"
+                f"{pages / revalidated:>9.1f}"
+            )
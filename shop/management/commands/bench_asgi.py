@@ -0,0 +1,126 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db.backends.signals import connection_created
+from django.test import Client
+
+from shop.management.commands import bench_shop
+from shop.profiling import quantile
+
+SYNC_PATHS = ("/shop/", "/shop/category/light_motors/", "/shop/product/")
+ASYNC_PATHS = ("/shop/async/", "/shop/async/category/light_motors/", "/shop/async/product/")
+
+
+def wsgi_request(app, path, cookie):
+    environ = {"PATH_INFO": path, "HTTP_HOST": "testserver", "HTTP_COOKIE": cookie}
+    setup_testing_defaults(environ)
+    status = []
+    response = app(environ, lambda value, headers, exc_info=None: status.append(value))
+    b"".join(response)
+    response.close()
+    return int(status[0].split()[0])
+
+
+async def asgi_request(app, path, cookie):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"host", b"testserver"), (b"cookie", cookie.encode())],
+        "client": ("127.0.0.1", 0), "server": ("testserver", 80),
+    }
+    status = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await app(scope, receive, send)
+    return status[0]
+
+
+class Command(bench_shop.Command):
+    help = ("Seed a synthetic catalogue in a throwaway test database and compare the WSGI and ASGI handlers "
+            "on the catalogue pages under concurrent load")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--requests", type=int, default=600)
+        parser.add_argument("--connections", type=int, default=128)
+        parser.add_argument("--wsgi-threads", type=int, default=16)
+        parser.add_argument("--latency", type=float, default=2.0,
+                            help="simulated database round trip in milliseconds")
+
+    def run(self, options):
+        bench_shop.seed_catalogue(options["products"])
+        client = Client()
+        client.force_login(User.objects.create(username="bench"))
+        cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        latency = options["latency"] / 1000
+
+        def slow_execute(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def add_latency(sender, connection, **kwargs):
+            # connection_created also fires on reconnects inside execute_wrapper() blocks, which pop the
+            # last wrapper on exit, so the latency goes first and only once
+            if slow_execute not in connection.execute_wrappers:
+                connection.execute_wrappers.insert(0, slow_execute)
+
+        connection_created.connect(add_latency)
+        try:
+            self.stdout.write(f"{'handler':<30}{'reqs':>6}{'err':>5}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}")
+            self.report("wsgi, sync views", *self.run_wsgi(SYNC_PATHS, cookie, options))
+            self.report("asgi, sync views", *self.run_asgi(SYNC_PATHS, cookie, options))
+            self.report("asgi, async views", *self.run_asgi(ASYNC_PATHS, cookie, options))
+        finally:
+            connection_created.disconnect(add_latency)
+
+    def run_wsgi(self, paths, cookie, options):
+        app = WSGIHandler()
+
+        def timed(path):
+            started = time.perf_counter()
+            status = wsgi_request(app, path, cookie)
+            return status, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["wsgi_threads"]) as pool:
+            results = list(pool.map(timed, [paths[i % len(paths)] for i in range(options["requests"])]))
+        return results, time.perf_counter() - started
+
+    def run_asgi(self, paths, cookie, options):
+        app = ASGIHandler()
+        queue = [paths[i % len(paths)] for i in range(options["requests"])]
+        results = []
+
+        async def connection():
+            while queue:
+                path = queue.pop()
+                started = time.perf_counter()
+                status = await asgi_request(app, path, cookie)
+                results.append((status, time.perf_counter() - started))
+
+        async def main():
+            await asyncio.gather(*(connection() for _ in range(options["connections"])))
+
+        started = time.perf_counter()
+        asyncio.run(main())
+        return results, time.perf_counter() - started
+
+    def report(self, label, results, elapsed):
+        latencies = [latency for _, latency in results]
+        errors = sum(status >= 400 for status, _ in results)
+        self.stdout.write(
+            f"{label:<30}{len(results):>6}{errors:>5}{len(results) / elapsed:>9.1f}"
+            f"{quantile(latencies, 0.5) * 1000:>9.1f}{quantile(latencies, 0.95) * 1000:>9.1f}"
+        )
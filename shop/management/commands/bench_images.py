@@ -0,0 +1,115 @@
+import multiprocessing
+import resource
+import tempfile
+import time
+from io import BytesIO
+
+from PIL import Image, ImageFile
+from django import forms
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+
+from shop.images import PRODUCT_RENDITIONS, build_renditions
+from shop.models import Product
+
+
+class DecodeCounter:
+
+    def __init__(self):
+        self.opens = 0
+        self.decodes = 0
+
+    def __enter__(self):
+        self.original_open = Image.open
+        self.original_load = ImageFile.ImageFile.load
+        counter = self
+
+        def counting_open(*args, **kwargs):
+            counter.opens += 1
+            return counter.original_open(*args, **kwargs)
+
+        def counting_load(img):
+            if img.tile:
+                counter.decodes += 1
+            return counter.original_load(img)
+
+        Image.open = counting_open
+        ImageFile.ImageFile.load = counting_load
+        return self
+
+    def __exit__(self, *exc_info):
+        Image.open = self.original_open
+        ImageFile.ImageFile.load = self.original_load
+
+
+def make_upload(content):
+    return forms.ImageField().clean(SimpleUploadedFile("bench.jpg", content, content_type="image/jpeg"))
+
+
+def legacy_path(content, storage):
+    image = make_upload(content)
+    img = Image.open(image)
+    img.height, img.width
+    img = Image.open(image)
+    img.height, img.width
+    img = Image.open(image)
+    resized_img = img.convert("RGB").resize((500, 500), Image.LANCZOS)
+    filestream = BytesIO()
+    resized_img.save(filestream, "JPEG", quality=90)
+
+
+def pipeline_path(content, storage):
+    image = make_upload(content)
+    Product.validate_image(image)
+    Product.validate_image(image)
+    image.seek(0)
+    build_renditions(storage, image.read(), PRODUCT_RENDITIONS)
+
+
+PATHS = {
+    "legacy": legacy_path,
+    "pipeline": pipeline_path,
+}
+
+
+def run_path(name, count, size, location, results):
+    filestream = BytesIO()
+    Image.effect_noise(size, 64).convert("RGB").save(filestream, "JPEG", quality=90)
+    content = filestream.getvalue()
+    storage = FileSystemStorage(location=location)
+    started = time.perf_counter()
+    with DecodeCounter() as counter:
+        for i in range(count):
+            PATHS[name](content[:-2] + i.to_bytes(2, "big"), storage)
+    results.put({
+        "path": name,
+        "seconds": time.perf_counter() - started,
+        "opens": counter.opens / count,
+        "decodes": counter.decodes / count,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    })
+
+
+class Command(BaseCommand):
+    help = "Compare image decode counts, time and peak RSS of the legacy and pipeline upload paths"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=20)
+        parser.add_argument("--size", type=int, nargs=2, default=(800, 800))
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        for name in PATHS:
+            with tempfile.TemporaryDirectory() as location:
+                process = context.Process(
+                    target=run_path, args=(name, options["count"], tuple(options["size"]), location, results)
+                )
+                process.start()
+                result = results.get()
+                process.join()
+            self.stdout.write(
+                "{path:>9}: {seconds:.3f}s, {opens:.1f} opens/upload, {decodes:.1f} decodes/upload, "
+                "peak RSS {peak_rss_kb} KB".format(**result)
+            )
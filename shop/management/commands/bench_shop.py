@@ -0,0 +1,120 @@
+import os
+import tempfile
+
+from PIL import Image
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+)
+from django.urls import reverse
+
+from shop import urls
+from shop.importer import CatalogueImporter
+from shop.models import Category, CommercialVehicles, LightMotor
+from shop.profiling import metrics
+
+VISCOSITIES = ("0W-20", "5W-30", "5W-40", "10W-40", "15W-40")
+SKIPPED_URLS = {
+    "metrics": "служебный",
+}
+
+
+def get_scenario(product, category):
+    order = {"first_name": "Ivan", "last_name": "Petrov", "phone": "1", "buying_type": "self",
+             "order_date": "2021-03-01"}
+    return [
+        ("index", "get", {}, None),
+        ("product_detail", "get", {}, None),
+        ("category_detail", "get", {"slug": category.slug}, None),
+        ("category_products_api", "get", {"slug": category.slug}, {"order": "title"}),
+        ("light_motor-specification", "get", {}, None),
+        ("search", "get", {}, {"q": "oil 5w"}),
+        ("autocomplete", "get", {}, {"q": "oi"}),
+        ("feedback", "get", {}, None),
+        ("create", "get", {}, None),
+        ("add_to_cart", "get", {"slug": product.slug}, None),
+        ("change_quantity", "post", {"slug": product.slug}, {"quantity": 2}),
+        ("cart", "get", {}, None),
+        ("checkout", "get", {}, None),
+        ("delete_from_cart", "get", {"slug": product.slug}, None),
+        ("add_to_cart", "get", {"slug": product.slug}, None),
+        ("make_order", "post", {}, order),
+        ("orders", "get", {}, None),
+    ]
+
+
+def seed_rows(model, count, image):
+    for i in range(count):
+        yield i, {
+            "vendor_code": f"{model.__name__[0]}{i:05d}",
+            "title": f"{model._meta.verbose_name} oil {i}",
+            "price": str(100 + i % 900),
+            "product_group": "oil",
+            "viscosity": VISCOSITIES[i % len(VISCOSITIES)],
+            "volume": str(1 + i % 5),
+            "image": image,
+        }
+
+
+def seed_catalogue(count):
+    image = os.path.join(tempfile.mkdtemp(), "bench.jpg")
+    Image.effect_noise((600, 600), 64).convert("RGB").save(image, "JPEG")
+    for model, slug in ((LightMotor, "light_motors"), (CommercialVehicles, "commercial_vehicles")):
+        Category.objects.create(name=slug, slug=slug)
+        for _ in CatalogueImporter(model, batch_size=500).run(seed_rows(model, count, image)):
+            pass
+
+
+class Command(BaseCommand):
+    help = "Seed a synthetic catalogue in a throwaway test database and replay the shop URLs with the test client"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--anonymous", action="store_true")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        # the read replica becomes a mirror of the throwaway database, as in the test runner
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(MEDIA_ROOT=tempfile.mkdtemp(), SHOP_IMAGE_WORKERS=0, SHOP_PROFILING=True,
+                                   DEBUG=False):
+                self.run(options)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+    def run(self, options):
+        seed_catalogue(options["products"])
+        client = Client(raise_request_exception=False)
+        if not options["anonymous"]:
+            client.force_login(User.objects.create(username="bench"))
+        scenario = get_scenario(LightMotor.objects.order_by("pk").first(), Category.objects.get(slug="light_motors"))
+        covered = {name for name, *_ in scenario}
+        for pattern in urls.urlpatterns:
+            if pattern.name not in covered:
+                reason = SKIPPED_URLS.get(pattern.name, "нет сценария")
+                self.stdout.write(f"skipped {pattern.name}: {reason}")
+        for name, method, kwargs, data in scenario:
+            getattr(client, method)(reverse(name, kwargs=kwargs), data)
+        metrics.clear()
+        for _ in range(options["repeat"]):
+            for name, method, kwargs, data in scenario:
+                getattr(client, method)(reverse(name, kwargs=kwargs), data)
+        self.report(metrics.summary())
+
+    def report(self, summary):
+        self.stdout.write(
+            f"{'view':<28}{'reqs':>6}{'err':>5}{'queries':>9}{'dup':>6}{'db ms':>8}{'tpl ms':>8}"
+            f"{'avg ms':>8}{'p95 ms':>8}"
+        )
+        for view, stats in summary.items():
+            self.stdout.write(
+                f"{view:<28}{stats['requests']:>6}{stats['errors']:>5}{stats['queries']:>9.1f}"
+                f"{stats['duplicate_queries']:>6.1f}{stats['db_time'] * 1000:>8.2f}"
+                f"{stats['template_time'] * 1000:>8.2f}{stats['total_time'] * 1000:>8.2f}"
+                f"{stats['quantiles']['0.95'] * 1000:>8.2f}"
+            )
@@ -0,0 +1,81 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.safestring import mark_safe
+
+from shop.models import Category, CommercialVehicles, LightMotor
+from templates.templatetags import specifications
+
+LEGACY_PRODUCT_SPEC = {
+    "lightmotor": {name: field for name, field in specifications.PRODUCT_SPEC[LightMotor]},
+}
+
+
+def legacy_product_spec(product):
+    model_name = product.__class__._meta.model_name
+    if isinstance(product, LightMotor):
+        if not product.under_a_specific_brand:
+            LEGACY_PRODUCT_SPEC["lightmotor"].pop("Марка автомобиля", None)
+            LEGACY_PRODUCT_SPEC["lightmotor"].pop("Год выпуска", None)
+        else:
+            LEGACY_PRODUCT_SPEC["lightmotor"]["Марка автомобиля"] = "brand"
+            LEGACY_PRODUCT_SPEC["lightmotor"]["Год выпуска"] = "year_of_issue"
+        table_content = ""
+        for name, value in LEGACY_PRODUCT_SPEC[model_name].items():
+            table_content += specifications.TABLE_CONTENT.format(name=name, value=getattr(product, value))
+        return mark_safe(specifications.TABLE_HEAD + table_content + specifications.TABLE_TAIL)
+
+
+def make_products(count):
+    category = Category(name="light_motors", slug="light_motors")
+    now = timezone.now()
+    products = []
+    for i in range(count):
+        product_class = LightMotor if i % 2 else CommercialVehicles
+        product = product_class(
+            pk=i + 1, category=category, title=f"Product {i}", vendor_code=f"{i:06d}", product_group="oil",
+            composition="synthetic", viscosity="5W-30", volume="4", classification="API SN",
+            manufacturer_approval="MB 229.5", updated=now
+        )
+        if product_class is LightMotor:
+            product.under_a_specific_brand = bool(i % 4 == 1)
+            product.brand = "BMW"
+            product.year_of_issue = datetime.date(2015, 1, 1)
+        products.append(product)
+    return products
+
+
+class Command(BaseCommand):
+    help = "Measure per-render cost of the LightMotor specification table, legacy filter vs compiled layout"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=200)
+        parser.add_argument("--rounds", type=int, default=50)
+
+    def report(self, name, renders, seconds):
+        self.stdout.write(f"{name:>16}: {seconds / renders * 1e6:.2f} us/render over {renders} renders")
+
+    def handle(self, *args, **options):
+        products = [product for product in make_products(options["products"]) if isinstance(product, LightMotor)]
+        renders = len(products) * options["rounds"]
+
+        started = time.perf_counter()
+        for _ in range(options["rounds"]):
+            for product in products:
+                legacy_product_spec(product)
+        self.report("legacy", renders, time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for _ in range(options["rounds"]):
+            for product in products:
+                specifications.render_product_spec(product, specifications.SPEC_LAYOUTS[type(product)])
+        self.report("compiled", renders, time.perf_counter() - started)
+
+        specifications._spec_cache.clear()
+        started = time.perf_counter()
+        for _ in range(options["rounds"]):
+            for product in products:
+                specifications.product_spec(product)
+        self.report("compiled+cache", renders, time.perf_counter() - started)
@@ -0,0 +1,21 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from shop.export import DEFAULT_CHUNK_SIZE, FORMATS, get_catalogue_columns, iter_catalogue_rows, render
+from shop.models import Category
+from .export_orders import write_chunks
+
+
+class Command(BaseCommand):
+    help = "Stream LightMotor/CommercialVehicles products as CSV or JSONL in the import_catalogue layout"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", required=True, choices=sorted(Category.categories))
+        parser.add_argument("--format", choices=FORMATS, default="csv")
+        parser.add_argument("--output", help="по умолчанию stdout")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        model = apps.get_model("shop", options["model"])
+        rows = iter_catalogue_rows(model.objects.all(), options["chunk_size"])
+        write_chunks(render(options["format"], get_catalogue_columns(model), rows), options["output"], self.stdout)
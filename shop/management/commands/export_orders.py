@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from shop.export import DEFAULT_CHUNK_SIZE, FORMATS, ORDER_COLUMNS, filter_orders, iter_order_rows, render
+from shop.models import Order
+
+
+def date_argument(value):
+    date = parse_date(value)
+    if date is None:
+        raise ValueError(value)
+    return date
+
+
+class Command(BaseCommand):
+    help = "Stream orders with their cart lines as CSV or JSONL, optionally filtered by Order.created_at"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=FORMATS, default="csv")
+        parser.add_argument("--from", dest="date_from", type=date_argument, help="YYYY-MM-DD, включительно")
+        parser.add_argument("--to", dest="date_to", type=date_argument, help="YYYY-MM-DD, включительно")
+        parser.add_argument("--output", help="по умолчанию stdout")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        orders = filter_orders(Order.objects.all(), options["date_from"], options["date_to"])
+        rows = iter_order_rows(orders, options["chunk_size"])
+        write_chunks(render(options["format"], ORDER_COLUMNS, rows), options["output"], self.stdout)
+
+
+def write_chunks(chunks, path, stdout):
+    if path is None:
+        for chunk in chunks:
+            stdout.write(chunk, ending="")
+        return
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        file.writelines(chunks)
@@ -0,0 +1,51 @@
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.images import RenditionPipeline
+from shop.importer import FORMATS, CatalogueImporter, read_rows
+from shop.models import Category
+
+
+class Command(BaseCommand):
+    help = "Import LightMotor/CommercialVehicles products from a CSV or JSONL file, upserting by vendor_code"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--model", required=True, choices=sorted(Category.categories))
+        parser.add_argument("--format", choices=FORMATS, help="по умолчанию определяется по расширению файла")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--image-root", help="каталог, относительно которого указаны пути к изображениям")
+        parser.add_argument("--image-workers", type=int, default=4)
+        parser.add_argument("--progress-every", type=int, default=100000)
+
+    def handle(self, *args, **options):
+        model = apps.get_model("shop", options["model"])
+        importer = CatalogueImporter(
+            model,
+            batch_size=options["batch_size"],
+            image_root=options["image_root"],
+            image_pipeline=RenditionPipeline(workers=options["image_workers"]),
+            on_error=lambda line_number, message: self.stderr.write(f"строка {line_number}: {message}"),
+        )
+        try:
+            rows = read_rows(options["path"], options["format"])
+            started = time.perf_counter()
+            reported = 0
+            for stats in importer.run(rows):
+                if stats.rows - reported >= options["progress_every"]:
+                    reported = stats.rows
+                    self.stdout.write(self.format_progress(stats, time.perf_counter() - started))
+        except (OSError, ValueError) as exc:
+            raise CommandError(exc)
+        stats = importer.stats
+        self.stdout.write(self.format_progress(stats, time.perf_counter() - started))
+        self.stdout.write(
+            f"created {stats.created}, updated {stats.updated}, skipped {stats.skipped}, "
+            f"images {stats.images} ({stats.images_failed} failed)"
+        )
+
+    @staticmethod
+    def format_progress(stats, seconds):
+        return f"{stats.rows} rows in {seconds:.1f}s, {stats.rows / seconds if seconds else 0:.0f} rows/sec"
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from shop.facets import rebuild_index
+from shop.models import CommercialVehicles, LightMotor
+
+
+class Command(BaseCommand):
+    help = "Rebuild the storefront facet index for LightMotor and CommercialVehicles"
+
+    def handle(self, *args, **options):
+        for model in (LightMotor, CommercialVehicles):
+            rebuild_index(model)
+            self.stdout.write(f"{model._meta.verbose_name}: facet index rebuilt")
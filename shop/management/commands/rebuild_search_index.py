@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from shop import search
+from shop.models import CommercialVehicles, LightMotor
+
+
+class Command(BaseCommand):
+    help = "Rebuild the product full-text search index and autocomplete terms"
+
+    def handle(self, *args, **options):
+        for model in (LightMotor, CommercialVehicles):
+            count = 0
+            for product in model.objects.iterator(chunk_size=1000):
+                search.index_product(product)
+                count += 1
+            self.stdout.write(f"{model._meta.verbose_name}: {count} products indexed")
@@ -0,0 +1,19 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop import stock
+
+
+class Command(BaseCommand):
+    help = "Return the stock reserved by carts left untouched for longer than SHOP_CART_RESERVATION_MINUTES"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--minutes", type=int, default=settings.SHOP_CART_RESERVATION_MINUTES)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(minutes=options["minutes"])
+        count = stock.release_abandoned_carts(cutoff)
+        self.stdout.write(f"{count} carts released")
@@ -0,0 +1,80 @@
+import asyncio
+
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from . import database
+from .cart import SessionCart, get_customer_cart
+from .executor import run_sync
+
+
+def get_cart(request):
+    if not hasattr(request, "_cached_cart"):
+        request._cached_cart = get_customer_cart(request.user)
+    return request._cached_cart
+
+
+def set_cart(request):
+    if request.user.is_authenticated:
+        request.cart = SimpleLazyObject(lambda: get_cart(request))
+        request.customer = SimpleLazyObject(lambda: get_cart(request).owner)
+    else:
+        request.cart = SessionCart(request.session)
+        request.customer = None
+
+
+class CartMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        set_cart(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        # resolving request.user loads the session and the user, which must not happen on the event loop
+        await run_sync(set_cart, request)
+        return await self.get_response(request)
+
+
+class ReplicaPinningMiddleware:
+    """Keeps a client that has changed catalogue data on the primary for SHOP_REPLICA_PIN_SECONDS."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = database.begin_request(database.PIN_COOKIE in request.COOKIES)
+        try:
+            response = self.get_response(request)
+        finally:
+            written = database.end_request(token)
+        return self.pin(response, written)
+
+    async def __acall__(self, request):
+        token = database.begin_request(database.PIN_COOKIE in request.COOKIES)
+        try:
+            response = await self.get_response(request)
+        finally:
+            written = database.end_request(token)
+        return self.pin(response, written)
+
+    @staticmethod
+    def pin(response, written):
+        if written:
+            response.set_cookie(database.PIN_COOKIE, "1", max_age=getattr(settings, "SHOP_REPLICA_PIN_SECONDS", 5),
+                                httponly=True, samesite="Lax")
+        return response
@@ -0,0 +1,22 @@
+# Generated by Django 3.1.5 on 2026-10-18 18:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_auto_20210129_1132'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='category',
+            options={'ordering': ('name',), 'verbose_name': 'category', 'verbose_name_plural': 'categories'},
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, verbose_name='хэш изображения'),
+        ),
+    ]
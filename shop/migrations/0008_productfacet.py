@@ -0,0 +1,47 @@
+# Generated by Django 3.1.5 on 2026-10-18 18:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+FACET_FIELDS = ("product_group", "composition", "viscosity", "volume", "classification")
+
+
+def build_facet_index(apps, schema_editor):
+    ProductFacet = apps.get_model("shop", "ProductFacet")
+    for model_name in ("LightMotor", "CommercialVehicles"):
+        model = apps.get_model("shop", model_name)
+        ProductFacet.objects.bulk_create(
+            ProductFacet(product_id=product.pk, model_name=model._meta.model_name, facet=facet,
+                         value=getattr(product, facet))
+            for product in model.objects.iterator()
+            for facet in FACET_FIELDS if getattr(product, facet)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_product_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacet',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(max_length=100, verbose_name='тип товара')),
+                ('facet', models.CharField(max_length=50, verbose_name='фильтр')),
+                ('value', models.CharField(max_length=200, verbose_name='значение')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='shop.product', verbose_name='товар')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='productfacet',
+            index=models.Index(fields=['model_name', 'facet', 'value'], name='facet_value_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productfacet',
+            unique_together={('product', 'facet')},
+        ),
+        migrations.RunPython(build_facet_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,100 @@
+# Generated by Django 3.1.5 on 2026-10-18 18:14
+
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.utils import OperationalError
+
+SPEC_FIELDS = ("product_group", "composition", "viscosity", "volume", "classification", "manufacturer_approval")
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE shop_product_fts USING fts5("
+            "model_name UNINDEXED, title, description, vendor_code, specs, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+    except OperationalError:
+        pass
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS shop_product_fts")
+
+
+def build_search_index(apps, schema_editor):
+    ProductSearchDocument = apps.get_model("shop", "ProductSearchDocument")
+    SearchTerm = apps.get_model("shop", "SearchTerm")
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        has_fts_table = "shop_product_fts" in connection.introspection.table_names(cursor)
+    for model_name in ("LightMotor", "CommercialVehicles"):
+        model = apps.get_model("shop", model_name)
+        documents = []
+        for product in model.objects.iterator():
+            specs = (getattr(product, field, "") for field in SPEC_FIELDS)
+            fields = {
+                "title": product.title,
+                "description": product.description,
+                "vendor_code": product.vendor_code,
+                "specs": " ".join(str(value) for value in specs if value),
+            }
+            documents.append((product.pk, model._meta.model_name, fields))
+        ProductSearchDocument.objects.bulk_create(
+            ProductSearchDocument(product_id=pk, model_name=name, document=" ".join(fields.values()))
+            for pk, name, fields in documents
+        )
+        SearchTerm.objects.bulk_create(
+            SearchTerm(product_id=pk, model_name=name, term=term[:100])
+            for pk, name, fields in documents
+            for term in {token for token in TOKEN_RE.findall(" ".join(fields.values()).lower()) if len(token) >= 2}
+        )
+        if has_fts_table:
+            with connection.cursor() as cursor:
+                cursor.executemany(
+                    "INSERT INTO shop_product_fts (rowid, model_name, title, description, vendor_code, specs) "
+                    "VALUES (%s, %s, %s, %s, %s, %s)",
+                    [
+                        [pk, name, fields["title"], fields["description"], fields["vendor_code"], fields["specs"]]
+                        for pk, name, fields in documents
+                    ]
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_productfacet'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='shop.product', verbose_name='товар')),
+                ('model_name', models.CharField(db_index=True, max_length=100, verbose_name='тип товара')),
+                ('document', models.TextField(verbose_name='поисковый документ')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_name', models.CharField(max_length=100, verbose_name='тип товара')),
+                ('term', models.CharField(max_length=100, verbose_name='слово')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='shop.product', verbose_name='товар')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchterm',
+            index=models.Index(fields=['term', 'model_name'], name='search_term_idx'),
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+        migrations.RunPython(build_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.5 on 2026-10-18 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='slider',
+            name='slide_img_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 3.1.5 on 2026-10-18 18:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+from decimal import Decimal
+
+
+def snapshot_order_lines(apps, schema_editor):
+    Order = apps.get_model("shop", "Order")
+    OrderLine = apps.get_model("shop", "OrderLine")
+    ProductCart = apps.get_model("shop", "ProductCart")
+    for order_id, cart_id in Order.objects.filter(cart__isnull=False).values_list("id", "cart_id").iterator():
+        OrderLine.objects.bulk_create(
+            OrderLine(order_id=order_id, product_id=product_id, vendor_code=vendor_code, title=title,
+                      price=(total_price / quantity).quantize(Decimal("0.01")) if quantity else total_price,
+                      quantity=quantity, total_price=total_price)
+            for product_id, vendor_code, title, quantity, total_price in ProductCart.objects.filter(
+                cart_id=cart_id
+            ).order_by("pk").values_list(
+                "product_id", "product__vendor_code", "product__title", "quantity", "total_price"
+            )
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_slider_slide_img_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderLine',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vendor_code', models.CharField(max_length=6, verbose_name='артикул')),
+                ('title', models.CharField(max_length=255, verbose_name='наименование')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='цена')),
+                ('quantity', models.PositiveIntegerField(verbose_name='количество')),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='общая сумма')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='shop.order', verbose_name='заказ')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='shop.product', verbose_name='товар')),
+            ],
+            options={
+                'verbose_name': 'позиция заказа',
+                'verbose_name_plural': 'позиции заказа',
+                'ordering': ('order', 'id'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='orderline',
+            index=models.Index(fields=['order', 'id'], name='order_line_order_idx'),
+        ),
+        migrations.RunPython(snapshot_order_lines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,121 @@
+# Generated by Django 3.1.5 on 2026-10-18 18:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import OuterRef, Subquery
+
+
+def fill_order_line_categories(apps, schema_editor):
+    OrderLine = apps.get_model("shop", "OrderLine")
+    Product = apps.get_model("shop", "Product")
+    OrderLine.objects.filter(product__isnull=False).update(
+        category_id=Subquery(Product.objects.filter(pk=OuterRef("product_id")).values("category_id")[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_orderline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCategorySales',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='дата')),
+                ('buying_type', models.CharField(choices=[('self', 'Самовывоз'), ('delivery', 'Доставка')], max_length=100, verbose_name='тип заказа')),
+                ('status', models.CharField(choices=[('new', 'Новый заказ'), ('in_progress', 'Заказ в обработке'), ('is_ready', 'Заказ готов'), ('completed', 'Заказ выполнен')], max_length=100, verbose_name='статус заказа')),
+                ('units', models.IntegerField(default=0, verbose_name='продано единиц')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='выручка')),
+                ('orders', models.IntegerField(default=0, verbose_name='заказов')),
+            ],
+            options={
+                'verbose_name': 'продажи категории за день',
+                'verbose_name_plural': 'продажи категорий по дням',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyProductSales',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='дата')),
+                ('buying_type', models.CharField(choices=[('self', 'Самовывоз'), ('delivery', 'Доставка')], max_length=100, verbose_name='тип заказа')),
+                ('status', models.CharField(choices=[('new', 'Новый заказ'), ('in_progress', 'Заказ в обработке'), ('is_ready', 'Заказ готов'), ('completed', 'Заказ выполнен')], max_length=100, verbose_name='статус заказа')),
+                ('units', models.IntegerField(default=0, verbose_name='продано единиц')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='выручка')),
+                ('orders', models.IntegerField(default=0, verbose_name='заказов')),
+                ('vendor_code', models.CharField(max_length=6, verbose_name='артикул')),
+                ('title', models.CharField(max_length=255, verbose_name='наименование')),
+            ],
+            options={
+                'verbose_name': 'продажи товара за день',
+                'verbose_name_plural': 'продажи товаров по дням',
+            },
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='rollup_buying_type',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='rollup_date',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='rollup_status',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='orderline',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='shop.category', verbose_name='категория'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='дата создания заказа'),
+        ),
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='дата')),
+                ('buying_type', models.CharField(choices=[('self', 'Самовывоз'), ('delivery', 'Доставка')], max_length=100, verbose_name='тип заказа')),
+                ('status', models.CharField(choices=[('new', 'Новый заказ'), ('in_progress', 'Заказ в обработке'), ('is_ready', 'Заказ готов'), ('completed', 'Заказ выполнен')], max_length=100, verbose_name='статус заказа')),
+                ('units', models.IntegerField(default=0, verbose_name='продано единиц')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='выручка')),
+                ('orders', models.IntegerField(default=0, verbose_name='заказов')),
+            ],
+            options={
+                'verbose_name': 'продажи за день',
+                'verbose_name_plural': 'продажи по дням',
+                'unique_together': {('date', 'buying_type', 'status')},
+            },
+        ),
+        migrations.AddIndex(
+            model_name='dailyproductsales',
+            index=models.Index(fields=['date', 'status'], name='product_sales_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailyproductsales',
+            unique_together={('date', 'vendor_code', 'buying_type', 'status')},
+        ),
+        migrations.AddField(
+            model_name='dailycategorysales',
+            name='category',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='shop.category', verbose_name='категория'),
+        ),
+        migrations.AddIndex(
+            model_name='dailycategorysales',
+            index=models.Index(fields=['date', 'status'], name='category_sales_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='dailycategorysales',
+            unique_together={('date', 'category', 'buying_type', 'status')},
+        ),
+        migrations.RunPython(fill_order_line_categories, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.1.5 on 2026-10-18 18:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+PRODUCT_MODELS = ("LightMotor", "CommercialVehicles")
+
+
+def fill_content_types(apps, schema_editor):
+    ContentType = apps.get_model("contenttypes", "ContentType")
+    Product = apps.get_model("shop", "Product")
+    for model_name in PRODUCT_MODELS:
+        model = apps.get_model("shop", model_name)
+        content_type, _ = ContentType.objects.get_or_create(app_label="shop", model=model_name.lower())
+        Product.objects.filter(pk__in=model.objects.values("pk")).update(content_type=content_type)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('shop', '0012_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='content_type',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='contenttypes.contenttype', verbose_name='тип товара'),
+        ),
+        migrations.RunPython(fill_content_types, migrations.RunPython.noop),
+    ]
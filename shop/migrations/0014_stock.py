@@ -0,0 +1,36 @@
+# Generated by Django 3.1.5 on 2026-10-18 19:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.expressions
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_product_content_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Stock',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stock', serialize=False, to='shop.product', verbose_name='товар')),
+                ('on_hand', models.PositiveIntegerField(default=0, verbose_name='на складе')),
+                ('reserved', models.PositiveIntegerField(default=0, editable=False, verbose_name='в резерве')),
+            ],
+            options={
+                'verbose_name': 'остаток товара',
+                'verbose_name_plural': 'остатки товаров',
+            },
+        ),
+        migrations.AddField(
+            model_name='productcart',
+            name='reserved',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='в резерве'),
+        ),
+        migrations.AddConstraint(
+            model_name='stock',
+            constraint=models.CheckConstraint(check=models.Q(reserved__lte=django.db.models.expressions.F('on_hand')), name='stock_reserved_lte_on_hand'),
+        ),
+    ]
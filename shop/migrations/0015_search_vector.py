@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def add_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("ALTER TABLE shop_productsearchdocument ADD COLUMN search_vector tsvector")
+    schema_editor.execute("UPDATE shop_productsearchdocument SET search_vector = to_tsvector('simple', document)")
+    schema_editor.execute(
+        "CREATE INDEX search_document_vector_idx ON shop_productsearchdocument USING gin (search_vector)"
+    )
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("ALTER TABLE shop_productsearchdocument DROP COLUMN IF EXISTS search_vector")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_stock'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vector, drop_search_vector),
+    ]
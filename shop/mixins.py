@@ -2,44 +2,42 @@ from django.views.generic.detail import SingleObjectMixin
 from django.views.generic import View
 
 from .models import *
+from . import cache
+from .pagination import ORDERINGS, InvalidCursor, paginate
 
 
 class CategoryDetailMixin(SingleObjectMixin):
 
-    CATEGORY_SLUG_PRODUCT_MODEL = {
-        "light_motors": LightMotor,
-        "commercial_vehicles": CommercialVehicles
-    }
+    LISTING_FIELDS = ("id", "title", "slug", "image", "image_hash", "price", "created")
+
+    def get_category_products(self, category):
+        # the same rule as the sidebar and facet counts: only products in stock are listed
+        return Product.objects.filter(category=category, available=True).only(*self.LISTING_FIELDS)
+
+    def get_page(self, request, queryset, default_ordering="created"):
+        ordering = request.GET.get("order", default_ordering)
+        if ordering not in ORDERINGS:
+            ordering = default_ordering
+        try:
+            return paginate(queryset, ordering, request.GET.get("cursor"))
+        except InvalidCursor:
+            return paginate(queryset, ordering)
 
     def get_context_data(self, **kwargs):
         if isinstance(self.get_object(), Category):
-            model = self.CATEGORY_SLUG_PRODUCT_MODEL[self.get_object().slug]
+            page = self.get_page(self.request, self.get_category_products(self.get_object()))
             context = super().get_context_data(**kwargs)
-            context["categories"] = Category.objects.get_categories_for_left_sidebar()
-            context["category_products"] = model.objects.all()
+            context["categories"] = cache.get_categories_for_left_sidebar()
+            context["category_products"] = page.items
+            context["page"] = page
             return context
         context = super().get_context_data(**kwargs)
-        context["categories"] = Category.objects.get_categories_for_left_sidebar()
+        context["categories"] = cache.get_categories_for_left_sidebar()
         return context
 
 
 class CartMixin(View):
 
     def dispatch(self, request, *args, **kwargs):
-        if request.user.is_authenticated:
-            customer = Customer.objects.filter(user=request.user).first()
-            if not customer:
-                customer = Customer.objects.create(
-                    user=request.user
-                )
-            cart = Cart.objects.filter(owner=customer, in_order=False).first()
-            if not cart:
-                cart = Cart.objects.create(owner=customer)
-
-        else:
-            cart = Cart.objects.filter(for_anonymous_user=True).first()
-            if not cart:
-                cart = Cart.objects.create(for_anonymous_user=True)
-
-        self.cart = cart
+        self.cart = request.cart
         return super().dispatch(request, *args, **kwargs)
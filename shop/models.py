@@ -1,44 +1,70 @@
-from PIL import Image
-import sys
+from collections import namedtuple
 
-from django.db import models
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
 from django.core.validators import MaxLengthValidator
 
 from django.contrib.auth import get_user_model
 
 from django.urls import reverse
 
-from io import BytesIO
-from django.core.files.uploadedfile import InMemoryUploadedFile
 from django.utils import timezone
 
+from .images import SLIDER_RENDITIONS, pipeline, validate_image
+
 User = get_user_model()
 
 
 class LatestProductsManager:
+    FEED_FIELDS = ("id", "title", "slug", "image", "image_hash", "price")
 
     @staticmethod
-    def get_products_for_main_page(*args, **kwargs):
+    def get_product_models(*args):
+        models_by_slug = {slug: model_name for model_name, slug in Category.categories.items()}
+        return [(slug, apps.get_model("shop", models_by_slug[slug])) for slug in args if slug in models_by_slug]
+
+    def get_products_for_main_page(self, *args, **kwargs):
         with_respect_to = kwargs.get("with_respect_to")
-        products = []
-        products_models = LightMotor.objects.all().filter(model__in=args)
-        for products_model in products_models:
-            model_products = products_model.objects.all().model_class()._base_manager.all().order_by("-id")[5]
-            products.extend(model_products)
-        if with_respect_to:
-            products_model = LightMotor.objects.filter(model=with_respect_to)
-            if products_model.exists():
-                if with_respect_to in args:
-                    return sorted(
-                        products, key=lambda x: x.__class__._meta.model_name.startswith(with_respect_to), reverse=True
-                    )
-        return products
+        count = kwargs.get("count", 5)
+        querysets = []
+        for slug, products_model in self.get_product_models(*args):
+            latest = products_model._base_manager.order_by("-id").values("pk")[:count]
+            querysets.append(
+                products_model._base_manager.filter(pk__in=latest).annotate(
+                    model_name=models.Value(slug, output_field=models.CharField()),
+                    priority=models.Value(int(slug == with_respect_to), output_field=models.IntegerField())
+                ).values(*self.FEED_FIELDS, "model_name", "priority").order_by()
+            )
+        if not querysets:
+            return []
+        products = querysets[0].union(*querysets[1:], all=True)
+        return list(products.order_by("-priority", "-id"))
 
 
 class LatestProducts:
     objects = LatestProductsManager()
 
 
+CategoryItem = namedtuple("CategoryItem", ("name", "slug", "url", "count"))
+
+
+class CategoryManager(models.Manager):
+
+    def get_categories_for_left_sidebar(self):
+        categories = self.get_queryset().annotate(
+            count=models.Count("product", filter=models.Q(product__available=True))
+        ).values_list("name", "slug", "count")
+        return [
+            CategoryItem(name, slug, reverse("category_detail", kwargs={"slug": slug}), count)
+            for name, slug, count in categories
+        ]
+
+    def get_categories_for_left_slider(self):
+        return self.get_categories_for_left_sidebar()
+
+
 class Category(models.Model):
     name = models.CharField("Category", max_length=200, db_index=True)
     slug = models.SlugField(max_length=200, db_index=True, unique=True)
@@ -48,6 +74,8 @@ class Category(models.Model):
         "CommercialVehicles": "commercial_vehicles"
     }
 
+    objects = CategoryManager()
+
     def __str__(self):
         return self.name
 
@@ -60,7 +88,7 @@ class Category(models.Model):
         return self.name
 
     def get_absolute_url(self):
-        return reverse("category_detail", args=[str(self.id)], kwargs={"slug": self.slug})
+        return reverse("category_detail", kwargs={"slug": self.slug})
 
 
 class Product(models.Model):
@@ -72,10 +100,13 @@ class Product(models.Model):
         abstract = True
 
     category = models.ForeignKey(Category, verbose_name="категория транспорта", on_delete=models.CASCADE)
+    content_type = models.ForeignKey(ContentType, verbose_name="тип товара", null=True, editable=False,
+                                     on_delete=models.PROTECT)
     title = models.CharField(max_length=255, verbose_name="наименование", db_index=True)
     vendor_code = models.CharField(max_length=6, verbose_name="артикул", unique=True, db_index=True)
     slug = models.SlugField(max_length=255, unique=True, db_index=True)
     image = models.ImageField(verbose_name="изображение", blank=True)
+    image_hash = models.CharField(max_length=64, verbose_name="хэш изображения", blank=True, editable=False)
     description = models.TextField(verbose_name="описание продукта", blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="цена")
     available = models.BooleanField(verbose_name="в наличии", default=True)
@@ -85,35 +116,32 @@ class Product(models.Model):
     def get_model_name(self):
         return self.__class__.__name__.lower()
 
+    @classmethod
+    def validate_image(cls, image):
+        return validate_image(image, cls.MIN_RESOLUTION, cls.MAX_RESOLUTION, cls.MAX_IMAGE_SIZE)
+
     class Meta:
         ordering = ("title",)
         index_together = (("id", "slug"),)
+        indexes = [
+            models.Index(fields=["category", "created", "id"], name="product_category_created_idx"),
+            models.Index(fields=["category", "title", "id"], name="product_category_title_idx"),
+            models.Index(fields=["title", "id"], name="product_title_idx"),
+        ]
 
         def __str__(self):
             return f"{self.ordering}: {self.index_together}"
 
     def save(self, *args, **kwargs):
-        image = self.image
-        img = Image.open(image)
-        min_height, min_width = self.MIN_RESOLUTION
-        max_height, max_width = self.MAX_RESOLUTION
-        if img.height < min_height or img.width < min_width:
-            raise MinResolutionErrorException("Разрешение изображения меньше минимального!")
-        if img.height > max_height or img.width > max_width:
-            raise MaxResolutionErrorException("Разрешение изображения больше максимального!")
-
-        image = self.image
-        img = Image.open(image)
-        new_img = img.convert("RGB")
-        resized_new_img = new_img.resize((500, 500), Image.ANTIALIAS)
-        filestream = BytesIO()
-        resized_new_img.save(filestream, "JPEG", quality=90)
-        filestream.seek(0)
-        name = "{}.{}".format(*self.image.name.split("."))
-        self.image = InMemoryUploadedFile(
-            filestream, "ImageField", name, "jpeg/image", sys.getsizeof(filestream), None
-        )
+        if self.content_type_id is None and type(self) is not Product:
+            self.content_type = ContentType.objects.get_for_model(self)
+        image_uploaded = bool(self.image) and not self.image._committed
+        if image_uploaded:
+            self.validate_image(self.image.file)
+            self.image_hash = ""
         super().save(*args, **kwargs)
+        if image_uploaded:
+            transaction.on_commit(lambda: pipeline.submit(self))
 
 
 class LightMotor(Product):
@@ -143,7 +171,69 @@ class CommercialVehicles(Product):
     manufacturer_approval = models.CharField(max_length=200, verbose_name="одобрение производителей", blank=True)
 
     def __str__(self):
-        return f"{Product.vendor_code} {Product.title}"
+        return f"{self.vendor_code} {self.title}"
+
+
+class ProductFacet(models.Model):
+    product = models.ForeignKey(Product, verbose_name="товар", related_name="facets", on_delete=models.CASCADE)
+    model_name = models.CharField(max_length=100, verbose_name="тип товара")
+    facet = models.CharField(max_length=50, verbose_name="фильтр")
+    value = models.CharField(max_length=200, verbose_name="значение")
+
+    class Meta:
+        unique_together = (("product", "facet"),)
+        indexes = [
+            models.Index(fields=["model_name", "facet", "value"], name="facet_value_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.facet}={self.value}"
+
+
+class ProductSearchDocument(models.Model):
+    product = models.OneToOneField(Product, verbose_name="товар", related_name="search_document", primary_key=True,
+                                   on_delete=models.CASCADE)
+    model_name = models.CharField(max_length=100, verbose_name="тип товара", db_index=True)
+    document = models.TextField(verbose_name="поисковый документ")
+
+    def __str__(self):
+        return f"{self.model_name}:{self.product_id}"
+
+
+class SearchTerm(models.Model):
+    product = models.ForeignKey(Product, verbose_name="товар", related_name="search_terms", on_delete=models.CASCADE)
+    model_name = models.CharField(max_length=100, verbose_name="тип товара")
+    term = models.CharField(max_length=100, verbose_name="слово")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["term", "model_name"], name="search_term_idx"),
+        ]
+
+    def __str__(self):
+        return self.term
+
+
+class Stock(models.Model):
+    product = models.OneToOneField(Product, verbose_name="товар", related_name="stock", primary_key=True,
+                                   on_delete=models.CASCADE)
+    on_hand = models.PositiveIntegerField(verbose_name="на складе", default=0)
+    reserved = models.PositiveIntegerField(verbose_name="в резерве", default=0, editable=False)
+
+    class Meta:
+        verbose_name = "остаток товара"
+        verbose_name_plural = "остатки товаров"
+        constraints = [
+            models.CheckConstraint(check=models.Q(reserved__lte=models.F("on_hand")),
+                                   name="stock_reserved_lte_on_hand"),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.on_hand - self.reserved}/{self.on_hand}"
+
+    def clean(self):
+        if self.reserved > self.on_hand:
+            raise ValidationError(f"Нельзя оставить на складе меньше, чем в резерве ({self.reserved}).")
 
 
 class ProductCart(models.Model):
@@ -152,6 +242,7 @@ class ProductCart(models.Model):
                              on_delete=models.CASCADE)
     product = models.ForeignKey(Product, verbose_name="товар", on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(verbose_name="количество", default=1)
+    reserved = models.PositiveIntegerField(verbose_name="в резерве", default=0, editable=False)
     total_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="общая сумма")
 
     def __str__(self):
@@ -229,13 +320,93 @@ class Order(models.Model):
     )
 
     comments = models.TextField(verbose_name="комментарий к заказу", null=True, blank=True)
-    created_at = models.DateTimeField(verbose_name="дата создания заказа", auto_now=True)
+    created_at = models.DateTimeField(verbose_name="дата создания заказа", auto_now_add=True)
     order_data = models.DateField(verbose_name="дата получения заказа", default=timezone.now)
+    rollup_date = models.DateField(null=True, editable=False)
+    rollup_status = models.CharField(max_length=100, blank=True, editable=False)
+    rollup_buying_type = models.CharField(max_length=100, blank=True, editable=False)
 
     def __str__(self):
         return str(self.id)
 
 
+class OrderLine(models.Model):
+    order = models.ForeignKey(Order, verbose_name="заказ", related_name="lines", on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, verbose_name="товар", null=True, blank=True, on_delete=models.SET_NULL)
+    category = models.ForeignKey(Category, verbose_name="категория", null=True, blank=True,
+                                 on_delete=models.SET_NULL)
+    vendor_code = models.CharField(max_length=6, verbose_name="артикул")
+    title = models.CharField(max_length=255, verbose_name="наименование")
+    price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="цена")
+    quantity = models.PositiveIntegerField(verbose_name="количество")
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="общая сумма")
+
+    class Meta:
+        ordering = ("order", "id")
+        verbose_name = "позиция заказа"
+        verbose_name_plural = "позиции заказа"
+        indexes = [
+            models.Index(fields=["order", "id"], name="order_line_order_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.vendor_code} x {self.quantity}"
+
+
+class SalesRollup(models.Model):
+    date = models.DateField(verbose_name="дата")
+    buying_type = models.CharField(max_length=100, verbose_name="тип заказа", choices=Order.BUYING_TYPE_CHOICES)
+    status = models.CharField(max_length=100, verbose_name="статус заказа", choices=Order.STATUS_CHOICES)
+    units = models.IntegerField(verbose_name="продано единиц", default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, verbose_name="выручка", default=0)
+    orders = models.IntegerField(verbose_name="заказов", default=0)
+
+    class Meta:
+        abstract = True
+
+
+class DailySales(SalesRollup):
+
+    class Meta:
+        verbose_name = "продажи за день"
+        verbose_name_plural = "продажи по дням"
+        unique_together = (("date", "buying_type", "status"),)
+
+    def __str__(self):
+        return str(self.date)
+
+
+class DailyProductSales(SalesRollup):
+    vendor_code = models.CharField(max_length=6, verbose_name="артикул")
+    title = models.CharField(max_length=255, verbose_name="наименование")
+
+    class Meta:
+        verbose_name = "продажи товара за день"
+        verbose_name_plural = "продажи товаров по дням"
+        unique_together = (("date", "vendor_code", "buying_type", "status"),)
+        indexes = [
+            models.Index(fields=["date", "status"], name="product_sales_date_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.vendor_code}"
+
+
+class DailyCategorySales(SalesRollup):
+    category = models.ForeignKey(Category, verbose_name="категория", null=True, on_delete=models.SET_NULL)
+
+    class Meta:
+        verbose_name = "продажи категории за день"
+        verbose_name_plural = "продажи категорий по дням"
+        unique_together = (("date", "category", "buying_type", "status"),)
+        indexes = [
+            models.Index(fields=["date", "status"], name="category_sales_date_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.category_id}"
+
+
 class Slider(models.Model):
     name = models.CharField(max_length=100, validators=[MaxLengthValidator(100)],
                             error_messages={"max_length": "Очень большая длина"},
@@ -252,6 +423,7 @@ class Slider(models.Model):
     slide_img = models.ImageField(blank=False, upload_to="slider/",
                                   help_text="изображение обрежется до 1920x1024px",
                                   verbose_name="добавить изображение")
+    slide_img_hash = models.CharField(max_length=64, blank=True, editable=False)
 
     class Meta:
         verbose_name = "блок 1.0: Слайдер"
@@ -260,6 +432,16 @@ class Slider(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        image_uploaded = bool(self.slide_img) and not self.slide_img._committed
+        if image_uploaded:
+            self.slide_img_hash = ""
+        super().save(*args, **kwargs)
+        if image_uploaded:
+            transaction.on_commit(lambda: pipeline.submit(
+                self, "slide_img", "slide_img_hash", SLIDER_RENDITIONS, swap=None
+            ))
+
 
 class Review(models.Model):
     title = models.CharField("Title", max_length=50)
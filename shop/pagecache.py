@@ -0,0 +1,113 @@
+import asyncio
+import functools
+import hashlib
+import zlib
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache as page_cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from . import cache
+from .executor import run_sync
+
+PAGE_KEY = "shop:page:{}:{}"
+
+
+def is_cacheable_request(request):
+    """
+    Only anonymous visitors with an empty cart and nothing queued in the messages framework see the same
+    page; everyone else gets a fresh render with the cart badge and flash messages of their own.
+    """
+    if request.method not in ("GET", "HEAD"):
+        return False
+    if request.user.is_authenticated or (getattr(request, "cart", None) and request.cart.total_products):
+        return False
+    return not len(messages.get_messages(request))
+
+
+def is_cacheable_response(request, response):
+    return (
+        response.status_code == 200 and not response.streaming and not response.cookies
+        and not request.META.get("CSRF_COOKIE_USED") and not response.has_header("Cache-Control")
+    )
+
+
+def get_etag(name, request, versions):
+    key = f"{name}:{request.get_full_path()}:{'.'.join(str(version) for version in versions)}"
+    return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+
+class PageCache:
+
+    def __init__(self, name, models, timeout=None):
+        self.name = name
+        self.models = models
+        self.timeout = timeout
+
+    def lookup(self, request):
+        """Returns a finished response for a 304 or a cache hit, and the validators to store a miss under."""
+        if not is_cacheable_request(request):
+            return None, None
+        etag = get_etag(self.name, request, cache.get_versions(*self.models))
+        last_modified = int(cache.get_last_modified(*self.models))
+        response = get_conditional_response(request, etag, last_modified)
+        if response is not None:
+            return self.add_headers(response, etag, last_modified), None
+        cached = page_cache.get(PAGE_KEY.format(self.name, etag.strip('"')))
+        if cached is None:
+            return None, (etag, last_modified)
+        content_type, body = cached
+        response = HttpResponse(zlib.decompress(body), content_type=content_type)
+        return self.add_headers(response, etag, last_modified), None
+
+    def store(self, request, response, validators):
+        if validators is None or not is_cacheable_response(request, response):
+            patch_vary_headers(response, ("Cookie",))
+            return response
+        etag, last_modified = validators
+        timeout = self.timeout
+        if timeout is None:
+            timeout = getattr(settings, "SHOP_CACHE_TIMEOUT", 60 * 15)
+        page_cache.set(PAGE_KEY.format(self.name, etag.strip('"')),
+                       (response["Content-Type"], zlib.compress(response.content)), timeout)
+        return self.add_headers(response, etag, last_modified)
+
+    @staticmethod
+    def add_headers(response, etag, last_modified):
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(response, max_age=0, must_revalidate=True)
+        patch_vary_headers(response, ("Cookie",))
+        return response
+
+
+def anonymous_page(name, models, timeout=None):
+    """
+    Serves a catalogue page to anonymous visitors from a zlib-compressed copy keyed by the cache versions
+    of `models`, and answers conditional GETs with 304 before the view runs. Async views do the cache and
+    session work on the executor.
+    """
+    page = PageCache(name, models, timeout)
+
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                response, validators = await run_sync(page.lookup, request)
+                if response is None:
+                    response = await run_sync(page.store, request, await view(request, *args, **kwargs),
+                                              validators)
+                return response
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response, validators = page.lookup(request)
+            if response is None:
+                response = page.store(request, view(request, *args, **kwargs), validators)
+            return response
+        return wrapper
+    return decorator
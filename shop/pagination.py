@@ -0,0 +1,74 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+ORDERINGS = {
+    "created": "-created",
+    "title": "title",
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    __slots__ = ("items", "next_cursor")
+
+    def __init__(self, items, next_cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def get_value(item, name):
+    if isinstance(item, dict):
+        return item["id"] if name == "pk" else item[name]
+    return getattr(item, name)
+
+
+def encode_cursor(value, pk):
+    if isinstance(value, datetime.datetime):
+        # DjangoJSONEncoder drops microseconds below a millisecond, which would skip rows on the next page
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, pk], cls=DjangoJSONEncoder).encode()).decode()
+
+
+def decode_cursor(cursor, field):
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return field.to_python(value), int(pk)
+    except (binascii.Error, TypeError, ValueError, ValidationError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def get_page_size(per_page=None):
+    if per_page is None:
+        return getattr(settings, "SHOP_PAGE_SIZE", 24)
+    return max(1, min(per_page, getattr(settings, "SHOP_MAX_PAGE_SIZE", 100)))
+
+
+def paginate(queryset, ordering="created", cursor=None, per_page=None, orderings=ORDERINGS):
+    per_page = get_page_size(per_page)
+    field = orderings[ordering]
+    name = field.lstrip("-")
+    lookup = "lt" if field.startswith("-") else "gt"
+    if cursor:
+        value, pk = decode_cursor(cursor, queryset.model._meta.get_field(name))
+        queryset = queryset.filter(Q(**{f"{name}__{lookup}": value}) | Q(**{name: value, f"pk__{lookup}": pk}))
+    pk_order = "-pk" if lookup == "lt" else "pk"
+    items = list(queryset.order_by(field, pk_order)[:per_page + 1])
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = encode_cursor(get_value(items[-1], name), get_value(items[-1], "pk"))
+    return KeysetPage(items, next_cursor)
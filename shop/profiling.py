@@ -0,0 +1,261 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template
+
+DEFAULT_BUFFER_SIZE = 1000
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current = ContextVar("shop_request_profile", default=None)
+
+
+class RequestProfile:
+    __slots__ = ("view", "method", "status", "queries", "duplicate_queries", "db_time", "template_time",
+                 "total_time", "timestamp", "statements", "template_depth", "lock")
+
+    def __init__(self):
+        self.view = ""
+        self.method = ""
+        self.status = None
+        self.queries = 0
+        self.duplicate_queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.total_time = 0.0
+        self.timestamp = time.time()
+        self.statements = set()
+        self.template_depth = 0
+        self.lock = threading.Lock()
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            # async views run queries of one request on several executor threads
+            with self.lock:
+                self.db_time += elapsed
+                self.queries += 1
+                if sql in self.statements:
+                    self.duplicate_queries += 1
+                else:
+                    self.statements.add(sql)
+
+    def as_dict(self):
+        return {
+            "view": self.view,
+            "method": self.method,
+            "status": self.status,
+            "queries": self.queries,
+            "duplicate_queries": self.duplicate_queries,
+            "db_time": self.db_time,
+            "template_time": self.template_time,
+            "total_time": self.total_time,
+            "timestamp": self.timestamp,
+        }
+
+
+def quantile(values, q):
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+class MetricsBuffer:
+
+    def __init__(self, size=None):
+        self.size = size
+        self._profiles = None
+        self._lock = threading.Lock()
+
+    def get_profiles(self):
+        if self._profiles is None:
+            self._profiles = deque(maxlen=self.size or getattr(settings, "SHOP_METRICS_BUFFER_SIZE",
+                                                               DEFAULT_BUFFER_SIZE))
+        return self._profiles
+
+    def record(self, profile):
+        profile.statements = None
+        with self._lock:
+            self.get_profiles().append(profile)
+
+    def clear(self):
+        with self._lock:
+            self.get_profiles().clear()
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.get_profiles())
+
+    def summary(self):
+        views = {}
+        for profile in self.snapshot():
+            views.setdefault(profile.view, []).append(profile)
+        summary = {}
+        for view, profiles in sorted(views.items()):
+            count = len(profiles)
+            total_times = [profile.total_time for profile in profiles]
+            summary[view] = {
+                "requests": count,
+                "errors": sum(profile.status is None or profile.status >= 500 for profile in profiles),
+                "queries": sum(profile.queries for profile in profiles) / count,
+                "max_queries": max(profile.queries for profile in profiles),
+                "duplicate_queries": sum(profile.duplicate_queries for profile in profiles) / count,
+                "db_time": sum(profile.db_time for profile in profiles) / count,
+                "template_time": sum(profile.template_time for profile in profiles) / count,
+                "total_time": sum(total_times) / count,
+                "quantiles": {str(q): quantile(total_times, q) for q in QUANTILES},
+            }
+        return summary
+
+
+metrics = MetricsBuffer()
+
+PROMETHEUS_GAUGES = (
+    ("requests", "shop_view_requests", "Requests of the view in the metrics window"),
+    ("errors", "shop_view_errors", "Failed requests of the view in the metrics window"),
+    ("queries", "shop_view_queries_avg", "Average number of SQL queries per request"),
+    ("max_queries", "shop_view_queries_max", "Maximum number of SQL queries per request"),
+    ("duplicate_queries", "shop_view_duplicate_queries_avg", "Average number of repeated SQL statements per request"),
+    ("db_time", "shop_view_db_seconds_avg", "Average time spent in the database per request"),
+    ("template_time", "shop_view_template_seconds_avg", "Average template render time per request"),
+)
+
+
+def render_prometheus(summary):
+    lines = []
+    for key, name, description in PROMETHEUS_GAUGES:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} gauge")
+        for view, stats in summary.items():
+            lines.append(f'{name}{{view="{view}"}} {stats[key]}')
+    lines.append("# HELP shop_view_latency_seconds Request latency of the view in the metrics window")
+    lines.append("# TYPE shop_view_latency_seconds summary")
+    for view, stats in summary.items():
+        for q, value in stats["quantiles"].items():
+            lines.append(f'shop_view_latency_seconds{{view="{view}",quantile="{q}"}} {value}')
+        lines.append(f'shop_view_latency_seconds_sum{{view="{view}"}} {stats["total_time"] * stats["requests"]}')
+        lines.append(f'shop_view_latency_seconds_count{{view="{view}"}} {stats["requests"]}')
+    return "\n".join(lines) + "\n"
+
+
+class TemplateTimer:
+    """
+    Wraps Template.render only while profiled requests are in flight and puts the original method back
+    after the last one, so management commands and idle processes never render through the wrapper.
+    Renders outside a profiled context, e.g. in other threads, pass straight through.
+    """
+
+    def __init__(self):
+        self.active = 0
+        self.original = None
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        with self.lock:
+            if not self.active:
+                self.original = Template.render
+                Template.render = profiled_render
+            self.active += 1
+
+    def __exit__(self, *exc_info):
+        with self.lock:
+            self.active -= 1
+            if not self.active:
+                Template.render = self.original
+
+
+template_timer = TemplateTimer()
+
+
+def profiled_render(self, context=None, request=None):
+    original = template_timer.original
+    profile = _current.get()
+    if profile is None:
+        return original(self, context, request)
+    profile.template_depth += 1
+    started = time.perf_counter()
+    try:
+        return original(self, context, request)
+    finally:
+        profile.template_depth -= 1
+        if not profile.template_depth:
+            profile.template_time += time.perf_counter() - started
+
+
+def wrap_connections(stack, profile):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(profile.execute_wrapper))
+
+
+@contextmanager
+def capture_queries():
+    """Counts the queries of the current thread towards the profile of the request that started the work."""
+    profile = _current.get()
+    with ExitStack() as stack:
+        if profile is not None:
+            wrap_connections(stack, profile)
+        yield
+
+
+def get_view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    return match.view_name or match._func_path
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, "SHOP_PROFILING", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        profile = RequestProfile()
+        token = _current.set(profile)
+        started = time.perf_counter()
+        response = None
+        try:
+            with ExitStack() as stack:
+                stack.enter_context(template_timer)
+                wrap_connections(stack, profile)
+                response = self.get_response(request)
+            return response
+        finally:
+            _current.reset(token)
+            self.record(profile, request, response, started)
+
+    async def __acall__(self, request):
+        profile = RequestProfile()
+        token = _current.set(profile)
+        started = time.perf_counter()
+        response = None
+        try:
+            with template_timer:
+                response = await self.get_response(request)
+            return response
+        finally:
+            _current.reset(token)
+            self.record(profile, request, response, started)
+
+    def record(self, profile, request, response, started):
+        profile.total_time = time.perf_counter() - started
+        profile.view = get_view_name(request)
+        profile.method = request.method
+        profile.status = getattr(response, "status_code", None)
+        metrics.record(profile)
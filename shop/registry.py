@@ -0,0 +1,39 @@
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+
+from .models import Category, Product
+
+
+def get_product_models():
+    return [model for model in apps.get_app_config("shop").get_models() if issubclass(model, Product)
+            and model is not Product]
+
+
+def get_content_type(model):
+    return ContentType.objects.get_for_model(model)
+
+
+def get_model(content_type_id):
+    return ContentType.objects.get_for_id(content_type_id).model_class()
+
+
+def get_category_model(slug):
+    models_by_slug = {slug: model_name for model_name, slug in Category.categories.items()}
+    if slug not in models_by_slug:
+        return None
+    return apps.get_model("shop", models_by_slug[slug])
+
+
+def load_products(keys, select_related=("category",)):
+    """
+    Resolves (product_id, content_type_id) pairs to instances of their concrete product models with one
+    query per product type. Products without a known type are loaded as plain Product rows.
+    """
+    ids_by_type = {}
+    for product_id, content_type_id in keys:
+        ids_by_type.setdefault(content_type_id, set()).add(product_id)
+    products = {}
+    for content_type_id, ids in ids_by_type.items():
+        model = get_model(content_type_id) if content_type_id else Product
+        products.update(model._base_manager.select_related(*select_related).in_bulk(ids))
+    return products
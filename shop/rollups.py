@@ -0,0 +1,180 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .importer import batched
+from .models import DailyCategorySales, DailyProductSales, DailySales, Order, OrderLine
+
+ORDER_KEY_FIELDS = ("created_at", "status", "buying_type", "rollup_date", "rollup_status", "rollup_buying_type")
+LINE_FIELDS = ("vendor_code", "title", "category_id", "quantity", "total_price")
+DEFAULT_CHUNK_SIZE = 500
+TOP_PRODUCTS = 10
+
+
+def get_order_key(order):
+    return timezone.localdate(order.created_at), order.status, order.buying_type
+
+
+def get_rolled_key(order):
+    if order.rollup_date is None:
+        return None
+    return order.rollup_date, order.rollup_status, order.rollup_buying_type
+
+
+def increment(model, key, defaults, units, revenue, orders):
+    values = {"units": F("units") + units, "revenue": F("revenue") + revenue, "orders": F("orders") + orders}
+    if not model.objects.filter(**key).update(**values):
+        try:
+            with transaction.atomic():
+                model.objects.create(units=units, revenue=revenue, orders=orders, **key, **defaults)
+        except IntegrityError:
+            model.objects.filter(**key).update(**values)
+    if orders < 0:
+        model.objects.filter(orders__lte=0, **key).delete()
+
+
+class RollupDelta:
+    """Per-bucket changes of units, revenue and order count, applied with one UPDATE per touched bucket."""
+
+    def __init__(self):
+        self.totals = {}
+        self.products = {}
+        self.categories = {}
+
+    def add(self, key, lines, sign=1):
+        date, status, buying_type = key
+        total = self.totals.setdefault((date, buying_type, status), [0, Decimal(0), 0])
+        total[2] += sign
+        products, categories = {}, {}
+        for line in lines:
+            product = products.setdefault(line["vendor_code"], [line["title"], 0, Decimal(0)])
+            product[1] += line["quantity"]
+            product[2] += line["total_price"]
+            total[0] += sign * line["quantity"]
+            total[1] += sign * line["total_price"]
+            category = categories.setdefault(line["category_id"], [0, Decimal(0)])
+            category[0] += line["quantity"]
+            category[1] += line["total_price"]
+        for vendor_code, (title, units, revenue) in products.items():
+            row = self.products.setdefault((date, buying_type, status, vendor_code), [title, 0, Decimal(0), 0])
+            row[1] += sign * units
+            row[2] += sign * revenue
+            row[3] += sign
+        for category_id, (units, revenue) in categories.items():
+            row = self.categories.setdefault((date, buying_type, status, category_id), [0, Decimal(0), 0])
+            row[0] += sign * units
+            row[1] += sign * revenue
+            row[2] += sign
+
+    def apply(self):
+        for (date, buying_type, status), (units, revenue, orders) in self.totals.items():
+            if units or revenue or orders:
+                increment(DailySales, {"date": date, "buying_type": buying_type, "status": status}, {},
+                          units, revenue, orders)
+        for (date, buying_type, status, vendor_code), (title, units, revenue, orders) in self.products.items():
+            if units or revenue or orders:
+                increment(DailyProductSales,
+                          {"date": date, "buying_type": buying_type, "status": status, "vendor_code": vendor_code},
+                          {"title": title}, units, revenue, orders)
+        for (date, buying_type, status, category_id), (units, revenue, orders) in self.categories.items():
+            if units or revenue or orders:
+                increment(DailyCategorySales,
+                          {"date": date, "buying_type": buying_type, "status": status, "category_id": category_id},
+                          {}, units, revenue, orders)
+
+
+def roll_orders(orders, sign=1):
+    """
+    Moves each order's lines from the bucket they were last rolled into to the bucket of its current
+    date/status/buying_type. With sign=-1 the orders are only taken out of their rolled buckets.
+    """
+    if sign > 0:
+        orders = [order for order in orders if get_order_key(order) != get_rolled_key(order)]
+    else:
+        orders = [order for order in orders if get_rolled_key(order) is not None]
+    if not orders:
+        return 0
+    lines = {}
+    order_lines = OrderLine.objects.filter(order_id__in=[order.pk for order in orders])
+    for line in order_lines.values("order_id", *LINE_FIELDS):
+        lines.setdefault(line.pop("order_id"), []).append(line)
+    delta = RollupDelta()
+    for order in orders:
+        rolled = get_rolled_key(order)
+        if rolled is not None:
+            delta.add(rolled, lines.get(order.pk, ()), -1)
+        if sign > 0:
+            delta.add(get_order_key(order), lines.get(order.pk, ()))
+    delta.apply()
+    if sign > 0:
+        Order.objects.filter(pk__in=[order.pk for order in orders]).update(
+            rollup_date=TruncDate("created_at"), rollup_status=F("status"), rollup_buying_type=F("buying_type")
+        )
+    return len(orders)
+
+
+def locked_orders(ids):
+    # a no-op UPDATE locks the rows like SELECT ... FOR UPDATE, and on SQLite also takes the write lock up
+    # front, so the transaction waits for concurrent checkouts instead of failing to upgrade a read lock
+    Order.objects.filter(pk__in=ids).update(rollup_status=F("rollup_status"))
+    return list(Order.objects.filter(pk__in=ids).only(*ORDER_KEY_FIELDS))
+
+
+@transaction.atomic
+def sync_order(order_id):
+    return roll_orders(locked_orders([order_id]))
+
+
+@transaction.atomic
+def remove_order(order_id):
+    return roll_orders(locked_orders([order_id]), sign=-1)
+
+
+def rebuild(date_from=None, date_to=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Recomputes the rollups of a date range from the order line snapshots, one transaction per chunk."""
+    orders = Order.objects.all()
+    dates = {}
+    if date_from:
+        orders = orders.filter(created_at__date__gte=date_from)
+        dates["date__gte"] = date_from
+    if date_to:
+        orders = orders.filter(created_at__date__lte=date_to)
+        dates["date__lte"] = date_to
+    rolled = {f"rollup_{lookup}": value for lookup, value in dates.items()}
+    with transaction.atomic():
+        for model in (DailySales, DailyProductSales, DailyCategorySales):
+            model.objects.filter(**dates).delete()
+        Order.objects.filter(rollup_date__isnull=False, **rolled).update(
+            rollup_date=None, rollup_status="", rollup_buying_type=""
+        )
+    count = 0
+    for ids in batched(orders.order_by("pk").values_list("pk", flat=True).iterator(chunk_size=chunk_size),
+                       chunk_size):
+        with transaction.atomic():
+            count += roll_orders(locked_orders(ids))
+    return count
+
+
+def get_dashboard(date_from, date_to):
+    period = {"date__gte": date_from, "date__lte": date_to}
+    sales = DailySales.objects.filter(**period)
+    categories = DailyCategorySales.objects.filter(**period)
+    products = DailyProductSales.objects.filter(**period)
+    totals = {"units": Sum("units"), "revenue": Sum("revenue"), "orders": Sum("orders")}
+    statuses = list(sales.values("status").annotate(**totals).order_by("status"))
+    buying_types = list(sales.values("buying_type").annotate(**totals).order_by("buying_type"))
+    for rows, field, choices in ((statuses, "status", Order.STATUS_CHOICES),
+                                 (buying_types, "buying_type", Order.BUYING_TYPE_CHOICES)):
+        names = dict(choices)
+        for row in rows:
+            row["name"] = names.get(row[field], row[field])
+    return {
+        "days": list(sales.values("date").annotate(**totals).order_by("-date")),
+        "statuses": statuses,
+        "buying_types": buying_types,
+        "categories": list(categories.values("category__name").annotate(**totals).order_by("-revenue")),
+        "top_products": list(products.values("vendor_code").annotate(**totals).order_by("-revenue")[:TOP_PRODUCTS]),
+    }
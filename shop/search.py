@@ -0,0 +1,220 @@
+import re
+
+from django.db import connections, router, transaction
+from django.db.models.expressions import RawSQL
+
+from .facets import FACET_FIELDS
+from .models import Product, ProductSearchDocument, SearchTerm
+
+FTS_TABLE = "shop_product_fts"
+SEARCH_VECTOR_COLUMN = "search_vector"
+SPEC_FIELDS = tuple(FACET_FIELDS) + ("manufacturer_approval",)
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 100
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if len(token) >= MIN_TERM_LENGTH]
+
+
+def get_document_fields(product):
+    specs = (getattr(product, field, "") for field in SPEC_FIELDS)
+    return {
+        "title": product.title,
+        "description": product.description,
+        "vendor_code": product.vendor_code,
+        "specs": " ".join(str(value) for value in specs if value),
+    }
+
+
+def get_fts_match(tokens):
+    return " ".join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+
+
+def get_tsquery(tokens):
+    return " & ".join(f"{token}:*" for token in tokens)
+
+
+class DocumentSearchBackend:
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def index_many(self, documents):
+        pass
+
+    def remove(self, pk):
+        pass
+
+    def get_documents(self, tokens, model_name=None):
+        documents = ProductSearchDocument.objects.using(self.connection.alias)
+        if model_name:
+            documents = documents.filter(model_name=model_name)
+        for token in tokens:
+            documents = documents.filter(document__icontains=token)
+        return documents
+
+    def search(self, query, model_name=None, limit=50):
+        return list(self.get_documents(tokenize(query), model_name).values_list("product_id", flat=True)[:limit])
+
+    def filter(self, queryset, tokens):
+        return queryset.filter(pk__in=self.get_documents(tokens).values("product_id"))
+
+
+class SQLiteFTSBackend(DocumentSearchBackend):
+
+    def index_many(self, documents):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [[pk] for pk, _, _ in documents])
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, model_name, title, description, vendor_code, specs) "
+                f"VALUES (%s, %s, %s, %s, %s, %s)",
+                [
+                    [pk, model_name, fields["title"], fields["description"], fields["vendor_code"], fields["specs"]]
+                    for pk, model_name, fields in documents
+                ]
+            )
+
+    def remove(self, pk):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [pk])
+
+    def search(self, query, model_name=None, limit=50):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        sql = f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+        params = [get_fts_match(tokens)]
+        if model_name:
+            sql += " AND model_name = %s"
+            params.append(model_name)
+        sql += " ORDER BY rank LIMIT %s"
+        params.append(limit)
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def filter(self, queryset, tokens):
+        sql = f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+        return queryset.filter(pk__in=RawSQL(sql, [get_fts_match(tokens)]))
+
+
+class PostgresBackend(DocumentSearchBackend):
+    """Matches against the stored, GIN-indexed search_vector column that migration 0015 adds on PostgreSQL."""
+
+    table = ProductSearchDocument._meta.db_table
+
+    def index_many(self, documents):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {self.table} SET {SEARCH_VECTOR_COLUMN} = to_tsvector('simple', document) "
+                f"WHERE product_id = ANY(%s)",
+                [[pk for pk, _, _ in documents]]
+            )
+
+    def search(self, query, model_name=None, limit=50):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        sql = (
+            f"SELECT product_id FROM {self.table}, to_tsquery('simple', %s) query "
+            f"WHERE {SEARCH_VECTOR_COLUMN} @@ query"
+        )
+        params = [get_tsquery(tokens)]
+        if model_name:
+            sql += " AND model_name = %s"
+            params.append(model_name)
+        sql += f" ORDER BY ts_rank({SEARCH_VECTOR_COLUMN}, query) DESC LIMIT %s"
+        params.append(limit)
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def filter(self, queryset, tokens):
+        sql = f"SELECT product_id FROM {self.table} WHERE {SEARCH_VECTOR_COLUMN} @@ to_tsquery('simple', %s)"
+        return queryset.filter(pk__in=RawSQL(sql, [get_tsquery(tokens)]))
+
+
+_fts_tables = {}
+
+
+def fts_table_exists(connection):
+    key = (connection.alias, str(connection.settings_dict["NAME"]))
+    if key not in _fts_tables:
+        with connection.cursor() as cursor:
+            _fts_tables[key] = FTS_TABLE in connection.introspection.table_names(cursor)
+    return _fts_tables[key]
+
+
+def get_backend(using):
+    connection = connections[using]
+    if connection.vendor == "postgresql":
+        return PostgresBackend(connection)
+    if connection.vendor == "sqlite" and fts_table_exists(connection):
+        return SQLiteFTSBackend(connection)
+    return DocumentSearchBackend(connection)
+
+
+def get_read_backend():
+    """Search documents are replicated with the catalogue, so reads go where CatalogueRouter sends them."""
+    return get_backend(router.db_for_read(ProductSearchDocument))
+
+
+def get_write_backend():
+    return get_backend(router.db_for_write(ProductSearchDocument))
+
+
+def index_product(product):
+    index_products([product])
+
+
+@transaction.atomic
+def index_products(products):
+    pks = [product.pk for product in products]
+    documents = [(product.pk, product._meta.model_name, get_document_fields(product)) for product in products]
+    ProductSearchDocument.objects.filter(product_id__in=pks).delete()
+    ProductSearchDocument.objects.bulk_create(
+        ProductSearchDocument(product_id=pk, model_name=model_name, document=" ".join(fields.values()))
+        for pk, model_name, fields in documents
+    )
+    SearchTerm.objects.filter(product_id__in=pks).delete()
+    SearchTerm.objects.bulk_create(
+        SearchTerm(product_id=pk, model_name=model_name, term=term[:MAX_TERM_LENGTH])
+        for pk, model_name, fields in documents for term in set(tokenize(" ".join(fields.values())))
+    )
+    get_write_backend().index_many(documents)
+
+
+def remove_product(pk):
+    get_write_backend().remove(pk)
+
+
+def search(query, model=None, limit=50):
+    model_name = model._meta.model_name if model else None
+    return get_read_backend().search(query, model_name, limit)
+
+
+def filter_queryset(queryset, query):
+    """Narrows queryset to the matching products with a subquery, so every match is kept."""
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset.none()
+    return get_backend(queryset.db).filter(queryset, tokens)
+
+
+def search_products(query, model=Product, limit=50):
+    ids = search(query, None if model is Product else model, limit)
+    products = model.objects.in_bulk(ids)
+    return [products[pk] for pk in ids if pk in products]
+
+
+def autocomplete(prefix, model=None, limit=10):
+    tokens = tokenize(prefix)
+    if not tokens:
+        return []
+    prefix = tokens[-1]
+    terms = SearchTerm.objects.filter(term__gte=prefix, term__lt=prefix + "\uffff")
+    if model is not None:
+        terms = terms.filter(model_name=model._meta.model_name)
+    return list(terms.order_by("term").values_list("term", flat=True).distinct()[:limit])
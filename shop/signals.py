@@ -0,0 +1,71 @@
+from django.contrib.auth.signals import user_logged_in
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import bump_version
+from .cart import merge_session_cart
+from . import database, rollups, search
+from .facets import index_product
+from .models import Category, CommercialVehicles, LightMotor, Order, Review, Slider
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=LightMotor)
+@receiver(post_delete, sender=LightMotor)
+@receiver(post_save, sender=CommercialVehicles)
+@receiver(post_delete, sender=CommercialVehicles)
+@receiver(post_save, sender=Slider)
+@receiver(post_delete, sender=Slider)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_catalogue_cache(sender, **kwargs):
+    bump_version(sender)
+
+
+@receiver(post_save, sender=LightMotor)
+@receiver(post_save, sender=CommercialVehicles)
+def update_facet_index(sender, instance, **kwargs):
+    index_product(instance)
+
+
+@receiver(post_save, sender=LightMotor)
+@receiver(post_save, sender=CommercialVehicles)
+def update_search_index(sender, instance, **kwargs):
+    search.index_product(instance)
+
+
+@receiver(post_delete, sender=LightMotor)
+@receiver(post_delete, sender=CommercialVehicles)
+def remove_from_search_index(sender, instance, **kwargs):
+    search.remove_product(instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def update_sales_rollups(sender, instance, **kwargs):
+    # order lines are written later in the same transaction as the order itself
+    transaction.on_commit(lambda: rollups.sync_order(instance.pk))
+
+
+@receiver(pre_delete, sender=Order)
+def remove_from_sales_rollups(sender, instance, **kwargs):
+    rollups.remove_order(instance.pk)
+
+
+@receiver(user_logged_in)
+def merge_anonymous_cart(sender, request, user, **kwargs):
+    if request is not None and hasattr(request, "session"):
+        merge_session_cart(request.session, user)
+
+
+@receiver(connection_created)
+def apply_connection_pragmas(sender, connection, **kwargs):
+    database.apply_pragmas(connection)
+
+
+@receiver(request_started)
+def check_database_connections(sender, **kwargs):
+    database.check_connections()
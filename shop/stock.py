@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models import F
+
+from .models import Cart, ProductCart, Stock
+
+
+class OutOfStock(Exception):
+
+    def __init__(self, product_id):
+        super().__init__(f"Not enough stock for product {product_id}")
+        self.product_id = product_id
+
+
+def is_tracked(product_id):
+    return Stock.objects.filter(pk=product_id).exists()
+
+
+def reserve(product_id, quantity):
+    """
+    Holds quantity units for a cart. The check and the increment are one conditional UPDATE, so concurrent
+    reservations can never take more than on_hand - reserved. Products without a Stock row are not tracked.
+    """
+    if quantity <= 0:
+        return
+    updated = Stock.objects.filter(pk=product_id, on_hand__gte=F("reserved") + quantity).update(
+        reserved=F("reserved") + quantity
+    )
+    if not updated and is_tracked(product_id):
+        raise OutOfStock(product_id)
+
+
+def release(product_id, quantity):
+    if quantity > 0:
+        Stock.objects.filter(pk=product_id, reserved__gte=quantity).update(reserved=F("reserved") - quantity)
+
+
+def commit(product_id, quantity, reserved=0):
+    """Ships quantity units, reserved of which the cart already holds; the rest must still be free."""
+    updated = Stock.objects.filter(
+        pk=product_id, reserved__gte=reserved, on_hand__gte=F("reserved") + (quantity - reserved)
+    ).update(on_hand=F("on_hand") - quantity, reserved=F("reserved") - reserved)
+    if not updated and is_tracked(product_id):
+        raise OutOfStock(product_id)
+
+
+def commit_cart(cart):
+    """
+    Must run inside the checkout transaction: an OutOfStock from any line rolls the whole order back.
+    Lines go in product order so concurrent checkouts lock stock rows in the same order.
+    """
+    lines = list(ProductCart.objects.filter(cart=cart).order_by("product_id").values_list(
+        "product_id", "quantity", "reserved"
+    ))
+    for product_id, quantity, reserved in lines:
+        commit(product_id, quantity, reserved)
+    ProductCart.objects.filter(cart=cart, reserved__gt=0).update(reserved=0)
+
+
+def release_abandoned_carts(cutoff):
+    """Returns the reservations of carts left untouched since cutoff to the shelf; checkout re-reserves them."""
+    cart_ids = ProductCart.objects.filter(
+        reserved__gt=0, cart__in_order=False, cart__updated__lt=cutoff
+    ).values_list("cart_id", flat=True).distinct()
+    released = 0
+    for cart_id in list(cart_ids):
+        with transaction.atomic():
+            # locks the cart and checks it again, so a cart touched or ordered meanwhile keeps its stock
+            if not Cart.objects.filter(pk=cart_id, in_order=False, updated__lt=cutoff).update(updated=F("updated")):
+                continue
+            lines = ProductCart.objects.filter(cart_id=cart_id, reserved__gt=0).order_by("product_id")
+            for product_id, reserved in list(lines.values_list("product_id", "reserved")):
+                release(product_id, reserved)
+            lines.update(reserved=0)
+        released += 1
+    return released
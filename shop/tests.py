@@ -1,3 +1,1181 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django import forms
+from django.template import Context, Template
+from django.contrib import admin
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import connection, connections, transaction
+from asgiref.sync import sync_to_async
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.timezone import utc
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+
+from . import cache
+from . import cart as cart_service
+from .admin import LightMotorAdminForm, StockInline
+from .middleware import CartMiddleware
+from .pagination import paginate
+from . import database, export, facets, profiling, registry, search, stock
+from .importer import CatalogueImporter
+from .images import (
+    MaxResolutionErrorException, JOB_DONE, JOB_STALE, SLIDER_RENDITIONS, RenditionPipeline, rendition_path
+)
+from .models import (
+    Cart, Category, CommercialVehicles, Customer, DailyCategorySales, DailyProductSales, DailySales, LatestProducts,
+    LightMotor, Order, Product, ProductFacet, Slider, Stock, User
+)
+
+
+def make_image(name="product.jpg", size=(600, 600)):
+    filestream = BytesIO()
+    Image.new("RGB", size).save(filestream, "JPEG")
+    return SimpleUploadedFile(name, filestream.getvalue(), content_type="image/jpeg")
+
+
+def make_product(model, category, vendor_code, **kwargs):
+    kwargs.setdefault("title", f"Product {vendor_code}")
+    kwargs.setdefault("slug", f"product-{vendor_code}")
+    kwargs.setdefault("price", 100)
+    kwargs.setdefault("product_group", "oil")
+    kwargs.setdefault("viscosity", "5W-30")
+    return model.objects.create(category=category, vendor_code=vendor_code, image=make_image(), **kwargs)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class LatestProductsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.light_motors = Category.objects.create(name="light_motors", slug="light_motors")
+        cls.commercial_vehicles = Category.objects.create(name="commercial_vehicles", slug="commercial_vehicles")
+        for i in range(7):
+            make_product(LightMotor, cls.light_motors, f"L{i}")
+            make_product(CommercialVehicles, cls.commercial_vehicles, f"C{i}")
+
+    def test_feed_is_one_query(self):
+        with self.assertNumQueries(1):
+            LatestProducts.objects.get_products_for_main_page(
+                *Category.categories.values(), with_respect_to="light_motors"
+            )
+
+    def test_homepage_query_count(self):
+        default_cache.clear()
+        # sidebar, feed and slider, however many products there are
+        with self.assertNumQueries(3):
+            response = self.client.get("/shop/")
+        self.assertEqual(len(response.context["products"]), 10)
+        make_product(LightMotor, self.light_motors, "L7")
+        # a new product invalidates the page, the feed and the sidebar; the slider block stays cached
+        with self.assertNumQueries(2):
+            self.client.get("/shop/")
+        with self.assertNumQueries(0):
+            self.client.get("/shop/")
+
+    def test_feed_keeps_priority_ordering(self):
+        products = LatestProducts.objects.get_products_for_main_page(
+            "light_motors", "commercial_vehicles", with_respect_to="commercial_vehicles"
+        )
+        self.assertEqual(len(products), 10)
+        self.assertEqual([p["model_name"] for p in products[:5]], ["commercial_vehicles"] * 5)
+        self.assertEqual(products[0]["slug"], "product-C6")
+        self.assertEqual(products[5]["slug"], "product-L6")
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class CatalogueCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.light_motors = Category.objects.create(name="light_motors", slug="light_motors")
+        make_product(LightMotor, cls.light_motors, "L0")
+
+    def setUp(self):
+        default_cache.clear()
+
+    def test_feed_is_served_from_cache(self):
+        cache.get_products_for_main_page()
+        with self.assertNumQueries(0):
+            products = cache.get_products_for_main_page()
+        self.assertEqual([p["slug"] for p in products], ["product-L0"])
+
+    def test_product_save_invalidates_feed(self):
+        cache.get_products_for_main_page()
+        make_product(LightMotor, self.light_motors, "L1")
+        with self.assertNumQueries(1):
+            products = cache.get_products_for_main_page()
+        self.assertEqual([p["slug"] for p in products], ["product-L1", "product-L0"])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class CategoryManagerTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.light_motors = Category.objects.create(name="light_motors", slug="light_motors")
+        cls.commercial_vehicles = Category.objects.create(name="commercial_vehicles", slug="commercial_vehicles")
+        Category.objects.create(name="empty", slug="empty")
+        make_product(LightMotor, cls.light_motors, "L0")
+        make_product(LightMotor, cls.light_motors, "L1")
+        make_product(LightMotor, cls.light_motors, "L2", available=False)
+        make_product(CommercialVehicles, cls.commercial_vehicles, "C0")
+
+    def test_sidebar_counts_in_one_query(self):
+        with self.assertNumQueries(1):
+            categories = Category.objects.get_categories_for_left_sidebar()
+        self.assertEqual(
+            [(c.slug, c.count) for c in categories],
+            [("commercial_vehicles", 1), ("empty", 0), ("light_motors", 2)]
+        )
+        self.assertEqual(categories[2].url, "/shop/category/light_motors/")
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RenditionPipelineTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.light_motors = Category.objects.create(name="light_motors", slug="light_motors")
+
+    def test_rendition_is_swapped_in(self):
+        product = make_product(LightMotor, self.light_motors, "L0")
+        job = RenditionPipeline(workers=0).submit(product)
+        self.assertEqual(job.status, JOB_DONE)
+        product.refresh_from_db()
+        self.assertEqual(product.image.name, job.result)
+        self.assertEqual(Image.open(product.image).size, (500, 500))
+        storage = product.image.storage
+        self.assertTrue(storage.exists(rendition_path(product.image_hash, "card", "webp")))
+        self.assertTrue(storage.exists(rendition_path(product.image_hash, "thumbnail", "jpeg")))
+
+    def test_identical_uploads_share_renditions(self):
+        first = make_product(LightMotor, self.light_motors, "L0")
+        second = make_product(LightMotor, self.light_motors, "L1")
+        pipeline = RenditionPipeline(workers=0)
+        pipeline.submit(first)
+        pipeline.submit(second)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.image_hash, second.image_hash)
+        self.assertEqual(first.image.name, second.image.name)
+
+    def test_rendition_urls_point_at_storage(self):
+        product = make_product(LightMotor, self.light_motors, "L0")
+        RenditionPipeline(workers=0).submit(product)
+        product.refresh_from_db()
+        template = Template('{% load renditions %}{% rendition product.image_hash "card" "webp" %}')
+        url = template.render(Context({"product": product}))
+        self.assertEqual(url, product.image.storage.url(rendition_path(product.image_hash, "card", "webp")))
+        self.assertTrue(url.startswith(f"{settings.MEDIA_URL}renditions/"))
+        # feed items are values() rows, so the fallback is built from the stored name
+        template = Template('{% load renditions %}{% picture "" fallback=product.image|media_url %}')
+        html = template.render(Context({"product": {"image": product.image.name}}))
+        self.assertIn(f'src="{product.image.url}"', html)
+
+    def test_stale_job_keeps_newer_upload(self):
+        product = make_product(LightMotor, self.light_motors, "L0")
+        LightMotor.objects.filter(pk=product.pk).update(image="newer.jpg")
+        job = RenditionPipeline(workers=0).submit(product)
+        self.assertEqual(job.status, JOB_STALE)
+        product.refresh_from_db()
+        self.assertEqual(product.image.name, "newer.jpg")
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), SHOP_IMAGE_WORKERS=0)
+class SliderBlockTest(TestCase):
+    template = Template("{% load slider_tag %}{% block_slider %}")
+
+    def setUp(self):
+        default_cache.clear()
+
+    def make_slide(self, name="Slide"):
+        slide = Slider.objects.create(name=name, slide_img=make_image("slide.jpg", (2400, 1280)))
+        RenditionPipeline(workers=0).submit(slide, "slide_img", "slide_img_hash", SLIDER_RENDITIONS, swap=None)
+        return slide
+
+    def test_slides_are_pre_cropped(self):
+        slide = self.make_slide()
+        slide.refresh_from_db()
+        storage = slide.slide_img.storage
+        self.assertTrue(slide.slide_img.name.startswith("slider/"))
+        self.assertEqual(
+            Image.open(storage.open(rendition_path(slide.slide_img_hash, "slider", "jpeg"))).size, (1920, 1024)
+        )
+        for size in SLIDER_RENDITIONS:
+            self.assertTrue(storage.exists(rendition_path(slide.slide_img_hash, size, "webp")))
+        html = self.template.render(Context())
+        self.assertIn("1280w", html)
+        self.assertNotIn(slide.slide_img.url, html)
+
+    def test_fragment_is_cached_until_slider_changes(self):
+        slide = self.make_slide()
+        self.template.render(Context())
+        with self.assertNumQueries(0):
+            html = self.template.render(Context())
+        self.assertIn('alt="Slide"', html)
+        slide.name = "Renamed"
+        slide.save()
+        self.assertIn('alt="Renamed"', self.template.render(Context()))
+        slide.delete()
+        self.assertNotIn("carousel", self.template.render(Context()))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImageValidationTest(TestCase):
+
+    def test_form_and_model_share_one_inspection(self):
+        upload = forms.ImageField().clean(make_image())
+        self.assertEqual(Product.validate_image(upload).width, 600)
+        with mock.patch("PIL.Image.open") as image_open:
+            Product.validate_image(upload)
+        image_open.assert_not_called()
+
+    def test_admin_form_rejects_small_image(self):
+        form_class = forms.modelform_factory(
+            LightMotor, form=LightMotorAdminForm, fields=("image", "under_a_specific_brand", "brand", "year_of_issue")
+        )
+        form = form_class(data={}, files={"image": make_image(size=(100, 100))})
+        self.assertIn("Разрешение изображения меньше минимального!", form.errors["image"])
+
+    @override_settings(SHOP_IMAGE_MAX_PIXELS=100 * 100)
+    def test_decoder_pixel_limit(self):
+        with self.assertRaises(MaxResolutionErrorException):
+            Product.validate_image(make_image())
+
+
+def run_in_threads(target, count):
+    errors = []
+
+    def run():
+        try:
+            target()
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=run) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), SHOP_IMAGE_WORKERS=0)
+class CartServiceTest(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        category = Category.objects.create(name="light_motors", slug="light_motors")
+        self.first = make_product(LightMotor, category, "L0", price=10)
+        self.second = make_product(LightMotor, category, "L1", price=25)
+        customer = Customer.objects.create(user=User.objects.create(username="customer"))
+        self.cart = Cart.objects.create(owner=customer)
+
+    def assertTotalsMatchLines(self):
+        cart = Cart.objects.get(pk=self.cart.pk)
+        lines = list(cart.related_products.all())
+        self.assertEqual(cart.total_products, len(lines))
+        self.assertEqual(cart.total_price, sum(line.total_price for line in lines))
+        self.assertEqual(set(cart.product.all()), set(lines))
+        return cart
+
+    def test_mutations_keep_totals(self):
+        cart_service.add_product(self.cart, self.first)
+        cart_service.add_product(self.cart, self.first)
+        cart_service.add_product(self.cart, self.second)
+        cart_service.change_quantity(self.cart, self.second, 3)
+        cart = self.assertTotalsMatchLines()
+        self.assertEqual((cart.total_products, cart.total_price), (2, 95))
+        cart_service.remove_product(self.cart, self.first)
+        cart = self.assertTotalsMatchLines()
+        self.assertEqual((cart.total_products, cart.total_price), (1, 75))
+
+    def test_concurrent_adds_keep_totals(self):
+        def add():
+            cart = Cart.objects.get(pk=self.cart.pk)
+            for product in (self.first, self.second) * 5:
+                cart_service.add_product(cart, product)
+
+        self.assertEqual(run_in_threads(add, 4), [])
+        cart = self.assertTotalsMatchLines()
+        self.assertEqual((cart.total_products, cart.total_price), (2, 4 * 5 * 35))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class SessionCartTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name="light_motors", slug="light_motors")
+        cls.product = make_product(LightMotor, category, "L0", price=10)
+        cls.user = User.objects.create(username="customer")
+
+    def test_anonymous_cart_does_not_touch_cart_tables(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f"/shop/add_to_cart/{self.product.slug}/")
+            self.client.get(f"/shop/add_to_cart/{self.product.slug}/")
+            response = self.client.get("/shop/cart/")
+        self.assertFalse([q for q in queries if "shop_cart" in q["sql"] or "shop_productcart" in q["sql"]])
+        self.assertEqual(response.context["cart"].total_price, 20)
+        self.assertEqual(Cart.objects.count(), 0)
+
+    def test_session_cart_merges_on_login(self):
+        session = SessionStore()
+        cart_service.add_product(cart_service.SessionCart(session), self.product, 3)
+        cart = cart_service.merge_session_cart(session, self.user)
+        cart = Cart.objects.get(pk=cart.pk)
+        self.assertEqual((cart.total_products, cart.total_price), (1, 30))
+        self.assertEqual(cart.related_products.get().quantity, 3)
+        self.assertEqual(cart_service.SessionCart(session).lines, {})
+
+    def test_change_quantity_view_rejects_invalid_values(self):
+        self.client.get(f"/shop/add_to_cart/{self.product.slug}/")
+        for data in ({"quantity": "0"}, {"quantity": "-2"}, {"quantity": "two"}, {}):
+            response = self.client.post(f"/shop/change_quantity/{self.product.slug}/", data)
+            self.assertEqual(response["Location"], "/shop/cart/")
+        response = self.client.get("/shop/cart/")
+        self.assertEqual(response.context["cart"].total_price, 10)
+        self.assertContains(response, "Укажите количество не меньше 1.")
+
+    def test_quantities_below_one_are_rejected(self):
+        session = SessionStore()
+        session_cart = cart_service.SessionCart(session)
+        cart_service.add_product(session_cart, self.product, 2)
+        for quantity in (0, -3):
+            with self.assertRaises(ValueError):
+                cart_service.change_quantity(session_cart, self.product, quantity)
+        self.assertEqual(session_cart.total_price, 20)
+        other = make_product(LightMotor, self.product.category, "L1", price=25)
+        session_cart.save_lines({**session_cart.lines, str(other.pk): [-1, "25"]})
+        cart = cart_service.merge_session_cart(session, self.user)
+        self.assertEqual(list(cart.related_products.values_list("product_id", "quantity")), [(self.product.pk, 2)])
+        with self.assertRaises(ValueError):
+            cart_service.change_quantity(cart, self.product, 0)
+        self.assertEqual(cart.related_products.get().quantity, 2)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class CartMiddlewareTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="customer")
+        customer = Customer.objects.create(user=cls.user)
+        cls.cart = Cart.objects.create(owner=customer)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_cart_is_not_resolved_unless_used(self):
+        request = RequestFactory().get("/")
+        request.user = self.user
+        with self.assertNumQueries(0):
+            CartMiddleware(lambda request: None)(request)
+        with self.assertNumQueries(1):
+            self.assertEqual(request.customer.user, self.user)
+            self.assertEqual(request.cart.pk, self.cart.pk)
+
+    def test_homepage_resolves_cart_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/shop/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([q for q in queries if 'FROM "shop_cart"' in q["sql"]]), 1)
+        self.assertFalse([q for q in queries if 'FROM "shop_customer"' in q["sql"]])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class KeysetPaginationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.light_motors = Category.objects.create(name="light_motors", slug="light_motors")
+        for i in range(7):
+            make_product(LightMotor, cls.light_motors, f"L{i}", title=f"Oil {i % 3}")
+
+    def walk(self, ordering):
+        slugs, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                page = paginate(Product.objects.filter(category=self.light_motors), ordering, cursor, 3)
+            slugs.extend(product.slug for product in page.items)
+            if not page.has_next:
+                return slugs
+            cursor = page.next_cursor
+
+    def test_pages_cover_catalogue_in_order(self):
+        by_created = list(Product.objects.order_by("-created", "-id").values_list("slug", flat=True))
+        by_title = list(Product.objects.order_by("title", "id").values_list("slug", flat=True))
+        self.assertEqual(self.walk("created"), by_created)
+        self.assertEqual(self.walk("title"), by_title)
+
+    def test_cursor_keeps_microseconds(self):
+        for i, pk in enumerate(Product.objects.order_by("id").values_list("pk", flat=True)):
+            Product.objects.filter(pk=pk).update(created=datetime.datetime(2021, 3, 1, 0, 0, 0, 100 * i, tzinfo=utc))
+        by_created = list(Product.objects.order_by("-created", "-id").values_list("slug", flat=True))
+        self.assertEqual(self.walk("created"), by_created)
+
+    def test_listing_api(self):
+        response = self.client.get("/shop/api/categories/light_motors/products/", {"limit": 5, "order": "title"})
+        data = response.json()
+        self.assertEqual(len(data["results"]), 5)
+        response = self.client.get(
+            "/shop/api/categories/light_motors/products/", {"limit": 5, "order": "title", "cursor": data["next"]}
+        )
+        self.assertEqual(len(response.json()["results"]), 2)
+        self.assertIsNone(response.json()["next"])
+        self.assertEqual(self.client.get("/shop/api/categories/missing/products/").status_code, 404)
+        self.assertEqual(
+            self.client.get("/shop/api/categories/light_motors/products/", {"cursor": "bad"}).status_code, 400
+        )
+
+    def test_category_page(self):
+        response = self.client.get("/shop/category/light_motors/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["category_products"]), 7)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class FacetTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.light_motors = Category.objects.create(name="light_motors", slug="light_motors")
+        make_product(LightMotor, cls.light_motors, "L0", viscosity="5W-30", volume="1")
+        make_product(LightMotor, cls.light_motors, "L1", viscosity="5W-30", volume="4")
+        make_product(LightMotor, cls.light_motors, "L2", viscosity="10W-40", volume="4")
+        make_product(LightMotor, cls.light_motors, "L3", viscosity="10W-40", volume="4", available=False)
+
+    def counts(self, selected):
+        with self.assertNumQueries(1):
+            return {facet: values for facet, name, values in facets.get_facet_counts(LightMotor, selected)}
+
+    def test_counts_without_selection(self):
+        counts = self.counts({})
+        self.assertEqual(counts["viscosity"], [("10W-40", 1, False), ("5W-30", 2, False)])
+        self.assertEqual(counts["volume"], [("1", 1, False), ("4", 2, False)])
+
+    def test_counts_are_disjunctive_within_facet(self):
+        counts = self.counts({"viscosity": ["5W-30"], "volume": ["4"]})
+        self.assertEqual(counts["viscosity"], [("10W-40", 1, False), ("5W-30", 1, True)])
+        self.assertEqual(counts["volume"], [("1", 1, False), ("4", 1, True)])
+        self.assertEqual(counts["product_group"], [("oil", 1, False)])
+        products = facets.filter_products(Product.objects.all(), {"viscosity": ["5W-30"], "volume": ["4"]})
+        self.assertEqual([p.slug for p in products], ["product-L1"])
+
+    def test_index_follows_product_save(self):
+        product = LightMotor.objects.get(vendor_code="L0")
+        product.viscosity = "0W-20"
+        product.save()
+        self.assertEqual(product.facets.get(facet="viscosity").value, "0W-20")
+
+    def test_category_page_filters(self):
+        response = self.client.get("/shop/category/light_motors/", {"viscosity": "10W-40"})
+        listed = [p.slug for p in response.context["category_products"]]
+        self.assertEqual(listed, ["product-L2"])
+        counts = {facet: values for facet, name, values in response.context["facets"]}
+        self.assertIn(("10W-40", len(listed), True), counts["viscosity"])
+        self.assertEqual(sum(count for value, count, selected in counts["volume"]), len(listed))
+        response = self.client.get("/shop/api/categories/light_motors/products/", {"viscosity": "10W-40"})
+        self.assertEqual([p["slug"] for p in response.json()["results"]], listed)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class SearchTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.light_motors = Category.objects.create(name="light_motors", slug="light_motors")
+        cls.commercial_vehicles = Category.objects.create(name="commercial_vehicles", slug="commercial_vehicles")
+        make_product(LightMotor, cls.light_motors, "L0", title="Mobil Super 3000", viscosity="5W-30")
+        make_product(LightMotor, cls.light_motors, "L1", title="Mobil Super 2000", viscosity="10W-40")
+        make_product(CommercialVehicles, cls.commercial_vehicles, "C0", title="Mobil Delvac MX",
+                     viscosity="15W-40")
+
+    def test_uses_sqlite_fts(self):
+        self.assertIsInstance(search.get_read_backend(), search.SQLiteFTSBackend)
+
+    def test_prefix_search(self):
+        self.assertEqual(len(search.search("mobil")), 3)
+        self.assertEqual(
+            [p.vendor_code for p in search.search_products("supe 3000")], ["L0"]
+        )
+        self.assertEqual([p.vendor_code for p in search.search_products("delv", CommercialVehicles)], ["C0"])
+        self.assertEqual(search.search("delvac", LightMotor), [])
+
+    def test_index_follows_save_and_delete(self):
+        product = LightMotor.objects.get(vendor_code="L1")
+        product.title = "Mobil Turbo"
+        product.save()
+        self.assertEqual(search.search("turbo"), [product.pk])
+        self.assertEqual(search.search("2000"), [])
+        product.delete()
+        self.assertEqual(search.search("turbo"), [])
+        self.assertEqual(search.autocomplete("tur"), [])
+
+    def test_autocomplete(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(search.autocomplete("mob"), ["mobil"])
+        self.assertEqual(search.autocomplete("mobil su"), ["super"])
+        self.assertEqual(search.autocomplete("10w", LightMotor), ["10w"])
+
+    def test_admin_search_uses_index(self):
+        from django.contrib import admin
+
+        model_admin = admin.site._registry[LightMotor]
+        queryset, use_distinct = model_admin.get_search_results(None, LightMotor.objects.all(), "3000")
+        self.assertEqual([p.vendor_code for p in queryset], ["L0"])
+        # matches are narrowed with a subquery, not a capped list of ids
+        queryset, use_distinct = model_admin.get_search_results(None, LightMotor.objects.all(), "mobil")
+        self.assertEqual(queryset.count(), 2)
+        self.assertIn("MATCH", str(queryset.query))
+        fallback = search.DocumentSearchBackend(connection).filter(LightMotor.objects.all(), ["mobil", "300"])
+        self.assertEqual([p.vendor_code for p in fallback], ["L0"])
+
+
+class ProductSpecTest(TestCase):
+
+    def make_light_motor(self, pk=1, **kwargs):
+        return LightMotor(pk=pk, title="Oil", product_group="oil", viscosity="5W-30", brand="BMW<script>",
+                          updated=timezone.now(), **kwargs)
+
+    def test_brand_rows_follow_product_without_mutating_layout(self):
+        from templates.templatetags.specifications import product_spec
+
+        generic = product_spec(self.make_light_motor(under_a_specific_brand=False))
+        self.assertNotIn("Марка автомобиля", generic)
+        branded = product_spec(self.make_light_motor(under_a_specific_brand=True, pk=2))
+        self.assertIn("Марка автомобиля", branded)
+        self.assertIn("BMW&lt;script&gt;", branded)
+        self.assertNotIn("Марка автомобиля", product_spec(self.make_light_motor(pk=3)))
+
+    def test_commercial_vehicles_and_cache_key(self):
+        from templates.templatetags.specifications import product_spec
+
+        product = CommercialVehicles(pk=1, viscosity="15W-40", volume="20", updated=timezone.now())
+        self.assertIn("15W-40", product_spec(product))
+        product.viscosity = "10W-40"
+        self.assertIn("15W-40", product_spec(product))
+        product.updated = timezone.now() + datetime.timedelta(seconds=1)
+        self.assertIn("10W-40", product_spec(product))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ImportCatalogueTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.light_motors = Category.objects.create(name="light_motors", slug="light_motors")
+        cls.commercial_vehicles = Category.objects.create(name="commercial_vehicles", slug="commercial_vehicles")
+        make_product(CommercialVehicles, cls.commercial_vehicles, "C0", title="Truck oil")
+
+    def import_file(self, content, suffix, *args):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, f"catalogue{suffix}")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+        with open(os.path.join(directory, "oil.jpg"), "wb") as file:
+            file.write(make_image().read())
+        stdout, stderr = StringIO(), StringIO()
+        call_command(
+            "import_catalogue", path, "--model", "LightMotor", "--image-root", directory, "--image-workers", "0",
+            "--batch-size", "2", *args, stdout=stdout, stderr=stderr
+        )
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_csv_rows_are_upserted_by_vendor_code(self):
+        stdout, stderr = self.import_file(
+            "vendor_code,title,price,product_group,viscosity,image\n"
+            "L0,Oil zero,100,oil,5W-30,oil.jpg\n"
+            "L1,Oil one,200,oil,10W-40,\n"
+            "L2,Oil two,300,oil,0W-20,\n",
+            ".csv"
+        )
+        self.assertIn("rows/sec", stdout)
+        self.assertIn("created 3, updated 0, skipped 0, images 1 (0 failed)", stdout)
+        product = LightMotor.objects.get(vendor_code="L0")
+        self.assertTrue(product.image_hash)
+        self.assertEqual(Image.open(product.image).size, (500, 500))
+        self.assertEqual(product.category, self.light_motors)
+        self.assertEqual(search.search_products("zero"), [product.product_ptr])
+        stdout, stderr = self.import_file(
+            "vendor_code,title,price,product_group,viscosity\nL1,Oil one,250,oil,5W-40\n", ".csv"
+        )
+        self.assertIn("created 0, updated 1", stdout)
+        product = LightMotor.objects.get(vendor_code="L1")
+        self.assertEqual((product.price, product.viscosity), (250, "5W-40"))
+        self.assertEqual(LightMotor.objects.count(), 3)
+        self.assertEqual(
+            list(ProductFacet.objects.filter(product=product, facet="viscosity").values_list("value", flat=True)),
+            ["5W-40"]
+        )
+
+    def test_partial_rows_keep_other_columns(self):
+        self.import_file(
+            '{"vendor_code": "A1", "title": "Oil", "slug": "custom-slug", "description": "long text", '
+            '"price": 10, "product_group": "oil", "viscosity": "5W-30", "composition": "synthetic"}\n',
+            ".jsonl"
+        )
+        stdout, stderr = self.import_file(
+            '{"vendor_code": "A1", "title": "Oil A1", "price": 12, "product_group": "oil", "viscosity": "5W-40"}\n'
+            '{"vendor_code": "A2", "title": "Oil A2", "price": 15, "product_group": "oil", "viscosity": "0W-20"}\n',
+            ".jsonl"
+        )
+        self.assertIn("created 1, updated 1", stdout)
+        product = LightMotor.objects.get(vendor_code="A1")
+        self.assertEqual(
+            (product.slug, product.description, product.title, product.price, product.viscosity, product.composition),
+            ("custom-slug", "long text", "Oil A1", 12, "5W-40", "synthetic")
+        )
+        self.assertEqual(product.facets.get(facet="composition").value, "synthetic")
+        self.assertEqual(LightMotor.objects.get(vendor_code="A2").slug, "oil-a2-a2")
+
+    def test_invalid_jsonl_rows_are_reported_and_skipped(self):
+        stdout, stderr = self.import_file(
+            '{"vendor_code": "L0", "title": "Oil", "price": 10, "product_group": "oil", "viscosity": "5W-30"}\n'
+            "not json\n"
+            '{"vendor_code": "L1", "title": "Oil", "price": "free", "product_group": "oil", "viscosity": "5W-30"}\n'
+            '{"vendor_code": "C0", "title": "Oil", "price": 10, "product_group": "oil", "viscosity": "5W-30"}\n'
+            '{"vendor_code": "L2", "title": "Oil", "price": 10, "category": "missing", "viscosity": "5W-30"}\n',
+            ".jsonl"
+        )
+        self.assertIn("created 1, updated 0, skipped 4", stdout)
+        for line_number in (2, 3, 4, 5):
+            self.assertIn(f"строка {line_number}:", stderr)
+        self.assertEqual(CommercialVehicles.objects.get(vendor_code="C0").title, "Truck oil")
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ExportTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.light_motors = Category.objects.create(name="light_motors", slug="light_motors")
+        first = make_product(LightMotor, cls.light_motors, "L0", price=10)
+        second = make_product(LightMotor, cls.light_motors, "L1", price=25)
+        cls.user = User.objects.create(username="manager", is_staff=True, is_superuser=True)
+        customer = Customer.objects.create(user=cls.user)
+        for day, products in ((1, [first, second]), (2, [first]), (3, [])):
+            cart = Cart.objects.create(owner=customer, in_order=True)
+            for product in products:
+                cart_service.add_product(cart, product, quantity=day)
+            order = Order.objects.create(customer=customer, first_name="Ivan", last_name="Petrov", phone="1",
+                                         cart=cart)
+            cart_service.snapshot_order_lines(order, cart)
+            Order.objects.filter(pk=order.pk).update(created_at=datetime.datetime(2021, 3, day, 12, tzinfo=utc))
+
+    def test_order_lines_use_fixed_queries_per_chunk(self):
+        with self.assertNumQueries(3):
+            rows = list(export.iter_order_rows(Order.objects.all(), chunk_size=2))
+        self.assertEqual([(row["vendor_code"], row["quantity"]) for row in rows],
+                         [("L0", 1), ("L1", 1), ("L0", 2), (None, None)])
+        self.assertEqual(rows[1]["total_price"], 25)
+
+    def test_export_orders_command_filters_by_date(self):
+        stdout = StringIO()
+        call_command("export_orders", "--format", "jsonl", "--from", "2021-03-02", "--to", "2021-03-02",
+                     stdout=stdout)
+        rows = [json.loads(line) for line in stdout.getvalue().splitlines()]
+        self.assertEqual([(row["vendor_code"], row["total_price"]) for row in rows], [("L0", "20.00")])
+
+    def test_admin_actions_stream(self):
+        self.client.force_login(self.user)
+        response = self.client.post("/admin/shop/order/", {
+            "action": "export_csv", "_selected_action": list(Order.objects.values_list("pk", flat=True)),
+        })
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:2], ["order_id", "created_at"])
+        self.assertEqual(len(lines), 5)
+        response = self.client.post("/admin/shop/lightmotor/", {
+            "action": "export_jsonl", "_selected_action": list(LightMotor.objects.values_list("pk", flat=True)),
+        })
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([(row["vendor_code"], row["category"]) for row in rows],
+                         [("L0", "light_motors"), ("L1", "light_motors")])
+
+    def test_catalogue_export_round_trips_through_import(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "catalogue.csv")
+        call_command("export_catalogue", "--model", "LightMotor", "--output", path)
+        image = LightMotor.objects.get(vendor_code="L0").image.name
+        LightMotor.objects.filter(vendor_code="L0").update(viscosity="0W-20")
+        stdout = StringIO()
+        call_command("import_catalogue", path, "--model", "LightMotor", "--image-workers", "0", stdout=stdout)
+        self.assertIn("updated 2, skipped 0, images 0", stdout.getvalue())
+        product = LightMotor.objects.get(vendor_code="L0")
+        self.assertEqual((product.viscosity, product.image.name), ("5W-30", image))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class OrderLineTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        light_motors = Category.objects.create(name="light_motors", slug="light_motors")
+        cls.product = make_product(LightMotor, light_motors, "L0", price=10)
+        cls.user = User.objects.create(username="customer")
+
+    def test_order_lines_keep_prices_at_checkout(self):
+        self.client.force_login(self.user)
+        cart = self.client.get("/shop/cart/").context["cart"]
+        cart_service.add_product(cart, self.product, quantity=3)
+        response = self.client.post("/shop/make_order/", {
+            "first_name": "Ivan", "last_name": "Petrov", "phone": "1", "buying_type": "self",
+            "order_date": "2021-03-01",
+        })
+        self.assertEqual(response.status_code, 302)
+        order = Order.objects.get()
+        self.assertEqual(
+            list(order.lines.values_list("vendor_code", "title", "price", "quantity", "total_price")),
+            [("L0", "Product L0", 10, 3, 30)]
+        )
+        LightMotor.objects.filter(pk=self.product.pk).update(price=99)
+        response = self.client.get("/shop/orders/")
+        self.assertEqual(list(response.context["orders"]), [order])
+        self.assertContains(response, "30.00 грн.")
+        self.assertNotContains(response, "99")
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), SHOP_IMAGE_WORKERS=0)
+class SalesRollupTest(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        self.light_motors = Category.objects.create(name="light_motors", slug="light_motors")
+        self.first = make_product(LightMotor, self.light_motors, "L0", price=10)
+        self.second = make_product(LightMotor, self.light_motors, "L1", price=25)
+        self.user = User.objects.create(username="manager", is_staff=True, is_superuser=True)
+        self.client.force_login(self.user)
+
+    def checkout(self, *lines, buying_type="self"):
+        cart = self.client.get("/shop/cart/").context["cart"]
+        for product, quantity in lines:
+            cart_service.add_product(cart, product, quantity)
+        self.client.post("/shop/make_order/", {
+            "first_name": "Ivan", "last_name": "Petrov", "phone": "1", "buying_type": buying_type,
+            "order_date": "2021-03-01",
+        })
+        return Order.objects.latest("id")
+
+    def totals(self, model=DailySales, *fields):
+        return sorted(model.objects.values_list(*fields, "status", "units", "revenue", "orders"))
+
+    def test_rollups_follow_order_lifecycle(self):
+        first = self.checkout((self.first, 2), (self.second, 1))
+        self.checkout((self.first, 1), buying_type="delivery")
+        self.assertEqual(sorted(DailySales.objects.values_list("buying_type", "status", "units", "revenue", "orders")),
+                         [("delivery", "new", 1, 10, 1), ("self", "new", 3, 45, 1)])
+        self.assertEqual(self.totals(DailyProductSales, "vendor_code"),
+                         [("L0", "new", 1, 10, 1), ("L0", "new", 2, 20, 1), ("L1", "new", 1, 25, 1)])
+        self.assertEqual(self.totals(DailyCategorySales, "category"),
+                         [(self.light_motors.pk, "new", 1, 10, 1), (self.light_motors.pk, "new", 3, 45, 1)])
+        first.status = Order.STATUS_COMPLETED
+        first.save()
+        self.assertEqual(self.totals(), [("completed", 3, 45, 1), ("new", 1, 10, 1)])
+        incremental = {model: self.totals(model) for model in (DailySales, DailyProductSales, DailyCategorySales)}
+        stdout = StringIO()
+        call_command("rebuild_rollups", "--chunk-size", "1", stdout=stdout)
+        self.assertIn("2 orders rolled up", stdout.getvalue())
+        for model, rows in incremental.items():
+            self.assertEqual(self.totals(model), rows)
+        first.delete()
+        self.assertEqual(self.totals(), [("new", 1, 10, 1)])
+        self.assertEqual(DailyProductSales.objects.count(), 1)
+
+    def test_dashboard_reads_only_rollups(self):
+        self.checkout((self.first, 2))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/admin/shop/dailysales/dashboard/", {"days": 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["statuses"][0]["name"], "Новый заказ")
+        self.assertContains(response, "light_motors")
+        rollup_queries = [query["sql"] for query in queries if "_daily" in query["sql"]]
+        self.assertEqual(len(rollup_queries), 5)
+        self.assertFalse([query["sql"] for query in queries if '"shop_order' in query["sql"]])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), SHOP_PROFILING=True)
+class ProfilingTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.light_motors = Category.objects.create(name="light_motors", slug="light_motors")
+        cls.product = make_product(LightMotor, cls.light_motors, "L0", price=10)
+
+    def setUp(self):
+        profiling.metrics.clear()
+
+    def test_middleware_records_queries_per_view(self):
+        self.client.get("/shop/")
+        self.client.get(f"/shop/add_to_cart/{self.product.slug}/")
+        self.client.get("/shop/cart/")
+        summary = profiling.metrics.summary()
+        self.assertEqual(summary["cart"]["requests"], 1)
+        self.assertEqual(summary["cart"]["duplicate_queries"], 0)
+        self.assertGreater(summary["cart"]["queries"], 0)
+        self.assertGreater(summary["cart"]["template_time"], 0)
+        self.assertIn("index", summary)
+
+    def test_template_render_is_restored_after_requests(self):
+        self.client.get("/shop/cart/")
+        self.assertIsNot(profiling.Template.render, profiling.profiled_render)
+        self.assertGreater(profiling.metrics.summary()["cart"]["template_time"], 0)
+
+    def test_metrics_endpoint(self):
+        self.client.get("/shop/")
+        self.assertEqual(self.client.get("/shop/_metrics").status_code, 404)
+        self.client.force_login(User.objects.create(username="manager", is_staff=True))
+        data = self.client.get("/shop/_metrics").json()
+        self.assertEqual(data["views"]["index"]["requests"], 1)
+        response = self.client.get("/shop/_metrics", {"format": "prometheus"})
+        self.assertIn('shop_view_requests{view="index"} 1', response.content.decode())
+        self.assertIn('shop_view_latency_seconds{view="index",quantile="0.95"}', response.content.decode())
+
+    @override_settings(SHOP_METRICS_TOKEN="s3cret")
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get("/shop/_metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 404)
+        response = self.client.get("/shop/_metrics", HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+        self.client.force_login(User.objects.create(username="customer"))
+        self.assertEqual(self.client.get("/shop/_metrics").status_code, 404)
+
+
+def import_products(model, count):
+    image = os.path.join(tempfile.mkdtemp(), "product.jpg")
+    Image.new("RGB", (600, 600)).save(image, "JPEG")
+    rows = [(i, {"vendor_code": f"{model.__name__[0]}{i:04d}", "title": f"Oil {i}", "price": "10",
+                 "product_group": "oil", "viscosity": "5W-30", "image": image}) for i in range(count)]
+    for _ in CatalogueImporter(model, image_pipeline=RenditionPipeline(workers=0)).run(rows):
+        pass
+    return list(model.objects.order_by("pk"))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ProductRegistryTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for model_name, slug in Category.categories.items():
+            Category.objects.create(name=slug, slug=slug)
+        cls.light_motors = import_products(LightMotor, 60)
+        cls.commercial_vehicles = import_products(CommercialVehicles, 40)
+        cls.user = User.objects.create(username="customer")
+
+    def test_content_type_follows_product_model(self):
+        product = make_product(CommercialVehicles, Category.objects.get(slug="commercial_vehicles"), "C9999")
+        self.assertEqual(Product.objects.get(pk=product.pk).content_type.model_class(), CommercialVehicles)
+        self.assertEqual(Product.objects.get(pk=self.light_motors[0].pk).content_type.model_class(), LightMotor)
+        self.assertEqual(registry.get_category_model("commercial_vehicles"), CommercialVehicles)
+        self.assertEqual(set(registry.get_product_models()), {LightMotor, CommercialVehicles})
+
+    def test_cart_lines_resolve_product_types(self):
+        self.client.force_login(self.user)
+        self.client.get(f"/shop/add_to_cart/{self.commercial_vehicles[0].slug}/")
+        self.client.get(f"/shop/add_to_cart/{self.light_motors[0].slug}/")
+        lines = cart_service.get_lines(Cart.objects.get(owner__user=self.user))
+        self.assertEqual([type(line.product) for line in lines], [CommercialVehicles, LightMotor])
+        self.client.get("/shop/cart/")
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.client.get("/shop/cart/").status_code, 200)
+        cart = Cart.objects.get(owner__user=self.user)
+        for product in self.light_motors[1:] + self.commercial_vehicles[1:]:
+            cart_service.add_product(cart, product)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get("/shop/cart/")
+        self.assertEqual(len(response.context["cart_lines"]), 100)
+        self.assertEqual(len(large), len(small))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class PageCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.light_motors = Category.objects.create(name="light_motors", slug="light_motors")
+        cls.product = make_product(LightMotor, cls.light_motors, "L0", price=10)
+
+    def setUp(self):
+        default_cache.clear()
+
+    def test_anonymous_pages_are_cached_and_revalidated(self):
+        response = self.client.get("/shop/category/light_motors/")
+        etag = response["ETag"]
+        self.assertIn("Cookie", response["Vary"])
+        self.assertIn("Last-Modified", response)
+        with self.assertNumQueries(0):
+            cached = self.client.get("/shop/category/light_motors/")
+        self.assertIsNone(cached.context)
+        self.assertEqual(cached.content, response.content)
+        not_modified = self.client.get("/shop/category/light_motors/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified["ETag"], etag)
+        self.assertEqual(not_modified["Cache-Control"], response["Cache-Control"])
+        self.assertIn("Cookie", not_modified["Vary"])
+        self.assertNotEqual(self.client.get("/shop/category/light_motors/", {"order": "title"})["ETag"], etag)
+        self.product.title = "Renamed"
+        self.product.save()
+        response = self.client.get("/shop/category/light_motors/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Renamed")
+
+    def test_personal_pages_are_not_cached(self):
+        self.client.get(f"/shop/add_to_cart/{self.product.slug}/")
+        self.client.get("/shop/cart/")
+        response = self.client.get("/shop/")
+        self.assertNotIn("ETag", response)
+        self.assertIn("Cookie", response["Vary"])
+        self.client.force_login(User.objects.create(username="customer"))
+        self.assertNotIn("ETag", self.client.get("/shop/category/light_motors/"))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class CatalogueApiTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.light_motors = Category.objects.create(name="light_motors", slug="light_motors")
+        cls.products = [make_product(LightMotor, cls.light_motors, f"L{i}", price=10 + i) for i in range(3)]
+
+    def test_list_pages_with_sparse_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/shop/api/light_motors/", {"fields": "title,price", "limit": 2,
+                                                                    "order": "title"})
+        data = response.json()
+        self.assertEqual(data["results"], [{"title": "Product L0", "price": "10.00"},
+                                           {"title": "Product L1", "price": "11.00"}])
+        self.assertNotIn("description", queries[-1]["sql"])
+        data = self.client.get("/shop/api/light_motors/", {"fields": "vendor_code", "limit": 2, "order": "title",
+                                                           "cursor": data["next"]}).json()
+        self.assertEqual(data, {"results": [{"vendor_code": "L2"}], "next": None})
+        self.assertEqual(self.client.get("/shop/api/light_motors/", {"fields": "secret"}).status_code, 400)
+        self.assertEqual(self.client.get("/shop/api/categories/").json()["results"],
+                         [{"id": self.light_motors.pk, "name": "light_motors", "slug": "light_motors"}])
+
+    def test_detail_and_etags(self):
+        url = f"/shop/api/light_motors/{self.products[0].slug}/"
+        response = self.client.get(url)
+        self.assertEqual((response.json()["vendor_code"], response.json()["category"]), ("L0", self.light_motors.pk))
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified["ETag"], response["ETag"])
+        self.assertEqual(not_modified["Cache-Control"], "max-age=0, must-revalidate")
+        self.assertEqual(not_modified["Vary"], response["Vary"])
+        self.products[0].price = 99
+        self.products[0].save()
+        response = self.client.get(url, {"fields": "price"}, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.json(), {"price": "99.00"})
+        self.assertEqual(self.client.get("/shop/api/light_motors/missing/").status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), SHOP_IMAGE_WORKERS=0, SHOP_PROFILING=True)
+class AsyncViewsTest(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        default_cache.clear()
+        self.light_motors = Category.objects.create(name="light_motors", slug="light_motors")
+        self.product = make_product(LightMotor, self.light_motors, "L0", price=10, viscosity="10W-40")
+        self.user = User.objects.create(username="customer")
+
+    async def test_catalogue_pages(self):
+        profiling.metrics.clear()
+        self.assertContains(await self.async_client.get("/shop/async/"), self.product.title)
+        response = await self.async_client.get("/shop/async/category/light_motors/")
+        self.assertContains(response, self.product.title)
+        sync_response = await sync_to_async(self.client.get)("/shop/category/light_motors/")
+        self.assertEqual(response.context["facets"], sync_response.context["facets"])
+        self.assertIn("ETag", response)
+        self.assertEqual((await self.async_client.get("/shop/async/category/missing/")).status_code, 404)
+        self.assertContains(await self.async_client.get("/shop/async/product/"), self.product.title)
+        self.assertGreater(profiling.metrics.summary()["async_category_detail"]["queries"], 0)
+
+    async def test_cart_mutations(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(f"/shop/async/add_to_cart/{self.product.slug}/")
+        self.assertEqual(response.status_code, 302)
+        await self.async_client.post(f"/shop/async/change_quantity/{self.product.slug}/", "quantity=3",
+                                     content_type="application/x-www-form-urlencoded")
+        for quantity in ("quantity=-1", "quantity=abc", ""):
+            response = await self.async_client.post(f"/shop/async/change_quantity/{self.product.slug}/", quantity,
+                                                    content_type="application/x-www-form-urlencoded")
+            self.assertEqual(response["Location"], "/shop/cart/")
+        cart = await sync_to_async(Cart.objects.get)(owner__user=self.user)
+        self.assertEqual((cart.total_products, cart.total_price), (1, 30))
+        self.assertNotIn("ETag", await self.async_client.get("/shop/async/"))
+        await self.async_client.get(f"/shop/async/remove_from_cart/{self.product.slug}/")
+        cart = await sync_to_async(Cart.objects.get)(pk=cart.pk)
+        self.assertEqual(cart.total_products, 0)
+        self.assertEqual((await self.async_client.get("/shop/async/add_to_cart/missing/")).status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), SHOP_IMAGE_WORKERS=0)
+class ReplicaRoutingTest(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        self.light_motors = Category.objects.create(name="light_motors", slug="light_motors")
+        self.product = make_product(LightMotor, self.light_motors, "L0", price=10)
+
+    def test_catalogue_reads_use_replica_outside_transactions(self):
+        self.assertEqual(Category.objects.all().db, "replica")
+        self.assertEqual(Order.objects.all().db, "default")
+        with transaction.atomic():
+            self.assertEqual(Category.objects.all().db, "default")
+        with CaptureQueriesContext(connections["replica"]) as queries:
+            self.assertIn(self.product.pk, search.search("product"))
+        self.assertIn(search.FTS_TABLE, queries[-1]["sql"])
+        token = database.begin_request(pinned=True)
+        self.assertEqual(LightMotor.objects.all().db, "default")
+        self.assertFalse(database.end_request(token))
+        response = self.client.post("/shop/create/", {"title": "Hi", "reviews": "Fast delivery"})
+        self.assertEqual(response.cookies[database.PIN_COOKIE]["max-age"], 5)
+        self.assertNotIn(database.PIN_COOKIE, self.client.get("/shop/feedback/").cookies)
+
+    def test_reads_do_not_block_on_checkout_transaction(self):
+        with connections["replica"].cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "delete")
+        self.assertTrue(database.is_test_database(connections["replica"]))
+        customer = Customer.objects.create(user=User.objects.create(username="customer"))
+        started, release = threading.Event(), threading.Event()
+
+        def checkout():
+            try:
+                with transaction.atomic():
+                    cart = Cart.objects.create(owner=customer)
+                    cart_service.add_product(cart, self.product, quantity=2)
+                    Order.objects.create(customer=customer, first_name="Ivan", last_name="Petrov", phone="1",
+                                         cart=cart)
+                    LightMotor.objects.filter(pk=self.product.pk).update(price=99)
+                    started.set()
+                    release.wait(10)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=checkout)
+        thread.start()
+        started.wait(10)
+        try:
+            began = time.perf_counter()
+            with CaptureQueriesContext(connections["replica"]) as queries:
+                self.assertEqual(LightMotor.objects.get(pk=self.product.pk).price, 10)
+                self.assertEqual(self.client.get("/shop/category/light_motors/").status_code, 200)
+            self.assertLess(time.perf_counter() - began, 2)
+            self.assertTrue(queries)
+        finally:
+            release.set()
+            thread.join()
+        self.assertEqual(LightMotor.objects.get(pk=self.product.pk).price, 99)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), SHOP_IMAGE_WORKERS=0)
+class StockReservationTest(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        category = Category.objects.create(name="light_motors", slug="light_motors")
+        self.product = make_product(LightMotor, category, "L0", price=10)
+        self.untracked = make_product(LightMotor, category, "L1", price=25)
+
+    def make_cart(self, username):
+        return Cart.objects.create(owner=Customer.objects.create(user=User.objects.create(username=username)))
+
+    def assertStock(self, on_hand, reserved):
+        self.assertEqual(Stock.objects.values_list("on_hand", "reserved").get(pk=self.product.pk), (on_hand, reserved))
+
+    def test_cart_mutations_follow_reservations(self):
+        Stock.objects.create(product=self.product, on_hand=5)
+        cart = self.make_cart("customer")
+        cart_service.add_product(cart, self.product, quantity=2)
+        cart_service.change_quantity(cart, self.product, 4)
+        self.assertStock(5, 4)
+        with self.assertRaises(stock.OutOfStock):
+            cart_service.add_product(cart, self.product, quantity=2)
+        self.assertEqual((Cart.objects.get(pk=cart.pk).total_price, cart.related_products.get().quantity), (40, 4))
+        cart_service.add_product(cart, self.untracked, quantity=100)
+        Cart.objects.filter(pk=cart.pk).update(updated=timezone.now() - datetime.timedelta(hours=1))
+        call_command("release_reservations", minutes=30, stdout=StringIO())
+        self.assertStock(5, 0)
+        cart_service.change_quantity(cart, self.product, 3)
+        self.assertStock(5, 3)
+        cart_service.remove_product(cart, self.product)
+        self.assertStock(5, 0)
+
+    def test_concurrent_reservations_do_not_oversell(self):
+        Stock.objects.create(product=self.product, on_hand=10)
+
+        def reserve():
+            # outside a cart transaction, so nothing but the UPDATE itself serializes the threads
+            for _ in range(3):
+                stock.reserve(self.product.pk, 1)
+
+        errors = run_in_threads(reserve, 20)
+        self.assertEqual({type(error) for error in errors}, {stock.OutOfStock})
+        self.assertStock(10, 10)
+
+    def test_concurrent_checkouts_do_not_oversell(self):
+        Stock.objects.create(product=self.product, on_hand=12)
+        clients = []
+        for i in range(12):
+            cart = self.make_cart(f"customer{i}")
+            cart_service.add_product(cart, self.product)
+            client = self.client_class()
+            client.force_login(cart.owner.user)
+            clients.append(client)
+        # the reservations lapse, so every checkout has to take its unit from what is left on the shelf
+        self.assertEqual(stock.release_abandoned_carts(timezone.now()), 12)
+        Stock.objects.filter(pk=self.product.pk).update(on_hand=5)
+        redirects = []
+
+        def checkout():
+            response = clients.pop().post("/shop/make_order/", {
+                "first_name": "Ivan", "last_name": "Petrov", "phone": "1", "buying_type": "self",
+                "order_date": "2021-03-01",
+            })
+            redirects.append(response["Location"])
+
+        self.assertEqual(run_in_threads(checkout, len(clients)), [])
+        self.assertEqual(sorted(redirects), ["/shop/"] * 5 + ["/shop/cart/"] * 7)
+        self.assertStock(0, 0)
+        self.assertEqual(Order.objects.count(), 5)
+        self.assertEqual(Cart.objects.filter(in_order=True).count(), 5)
+
+    def test_anonymous_checkout_is_rejected(self):
+        Stock.objects.create(product=self.product, on_hand=5)
+        self.client.get(f"/shop/add_to_cart/{self.product.slug}/")
+        response = self.client.post("/shop/make_order/", {
+            "first_name": "Ivan", "last_name": "Petrov", "phone": "1", "buying_type": "self",
+            "order_date": "2021-03-01",
+        })
+        self.assertEqual(response["Location"], "/shop/cart/")
+        self.assertFalse(Order.objects.exists())
+        self.assertStock(5, 0)
+
+    def test_admin_saves_only_on_hand(self):
+        Stock.objects.create(product=self.product, on_hand=5)
+        request = RequestFactory().get("/")
+        request.user = User.objects.create(username="manager", is_staff=True, is_superuser=True)
+        formset_class = StockInline(LightMotor, admin.site).get_formset(request, self.product)
+        formset = formset_class({
+            "stock-TOTAL_FORMS": 1, "stock-INITIAL_FORMS": 1, "stock-0-product": self.product.pk,
+            "stock-0-on_hand": 8,
+        }, instance=self.product)
+        self.assertTrue(formset.is_valid())
+        # a customer reserves units between the admin reading the row and saving it
+        stock.reserve(self.product.pk, 2)
+        formset.save()
+        self.assertStock(8, 2)
@@ -1,11 +1,12 @@
 from django.urls import path
-from . import views
+from . import api, async_views, views
 
 
 urlpatterns = [
     path("", views.IndexView.as_view(), name="index"),
     path("product/", views.ProductDetailView.as_view(), name="product_detail"),
     path("category/", views.CategoryDetailView.as_view(), name="category_detail"),
+    path("category/<str:slug>/", views.CategoryDetailView.as_view(), name="category_detail"),
     path("create/", views.create_feedback, name="create"),
     path("feedback/", views.review, name="feedback"),
     path("cart/", views.CartView.as_view(), name="cart"),
@@ -15,4 +16,24 @@ urlpatterns = [
     path("change_quantity/<str:slug>/", views.ChangeQuantityView.as_view(), name="change_quantity"),
     path("checkout/", views.CheckoutView.as_view(), name="checkout"),
     path("make_order/", views.MakeOrderView.as_view(), name="make_order"),
+    path("orders/", views.OrderHistoryView.as_view(), name="orders"),
+    path("search/", views.search_view, name="search"),
+    path("search/autocomplete/", views.autocomplete, name="autocomplete"),
+    path("api/categories/<str:slug>/products/", views.category_products_api, name="category_products_api"),
+    path("api/categories/", api.CategoryResourceView.as_view(), name="api_categories"),
+    path("api/categories/<str:slug>/", api.CategoryResourceView.as_view(), name="api_category"),
+    path("api/light_motors/", api.LightMotorResourceView.as_view(), name="api_light_motors"),
+    path("api/light_motors/<str:slug>/", api.LightMotorResourceView.as_view(), name="api_light_motor"),
+    path("api/commercial_vehicles/", api.CommercialVehiclesResourceView.as_view(), name="api_commercial_vehicles"),
+    path("api/commercial_vehicles/<str:slug>/", api.CommercialVehiclesResourceView.as_view(),
+         name="api_commercial_vehicle"),
+    path("async/", async_views.AsyncIndexView.as_view(), name="async_index"),
+    path("async/product/", async_views.AsyncProductDetailView.as_view(), name="async_product_detail"),
+    path("async/category/<str:slug>/", async_views.AsyncCategoryDetailView.as_view(), name="async_category_detail"),
+    path("async/add_to_cart/<str:slug>/", async_views.AsyncAddToCartView.as_view(), name="async_add_to_cart"),
+    path("async/remove_from_cart/<str:slug>/", async_views.AsyncDeleteFromCartView.as_view(),
+         name="async_delete_from_cart"),
+    path("async/change_quantity/<str:slug>/", async_views.AsyncChangeQuantityView.as_view(),
+         name="async_change_quantity"),
+    path("_metrics", views.metrics_view, name="metrics"),
 ]
@@ -1,29 +1,46 @@
+import hmac
+
 from django.db import transaction
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse
 from django.shortcuts import render, redirect
 from django.views.generic.detail import DetailView
 from .forms import OrderForm, ReviewForm
 from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.utils.decorators import method_decorator
 from .mixins import *
 from django.contrib import messages
-from .utils import recalc_cart
+from . import cart as cart_service
+from . import cache, facets, profiling, registry, search, stock
+from .pagecache import anonymous_page
+from .pagination import ORDERINGS, InvalidCursor, paginate
+
+CATALOGUE_MODELS = (Category, LightMotor, CommercialVehicles)
+OUT_OF_STOCK_MESSAGE = "Недостаточно товара на складе."
+LOGIN_REQUIRED_MESSAGE = "Войдите в аккаунт, чтобы оформить заказ."
+INVALID_QUANTITY_MESSAGE = "Укажите количество не меньше 1."
+
 
+def parse_quantity(value):
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        return None
+    return quantity if quantity >= cart_service.MIN_QUANTITY else None
 
+
+@method_decorator(anonymous_page("index", CATALOGUE_MODELS + (Slider,)), name="get")
 class IndexView(CartMixin, View):
 
     def get(self, request, *args, **kwargs):
-        customer = Customer.objects.get(user=request.user)
-        cart = Cart.objects.get(owner=customer)
-        categories = Category.objects.get_categories_for_left_slider()
-        products = LatestProducts.objects.get_products_for_main_page("light_motors", "commercial_vehicles",
-                                                                     with_respect_to="light_motors")
+        categories = cache.get_categories_for_left_sidebar()
+        products = cache.get_products_for_main_page()
         context = {
             "categories": categories,
             "products": products,
-            "cart": cart
         }
 
-        return render(request, "index.html", context)
+        return render(request, "shop/index.html", context)
 
 
 class ProductDetailView(DetailView, CartMixin, CategoryDetailMixin):
@@ -31,9 +48,10 @@ class ProductDetailView(DetailView, CartMixin, CategoryDetailMixin):
     def get(self, request, *args, **kwargs):
         template_name = "shop/product_detail.html"
 
-        products = LightMotor.objects.all()
+        page = self.get_page(request, LightMotor.objects.select_related("category"), default_ordering="title")
         context = {
-            "products": products
+            "products": page.items,
+            "page": page,
         }
         return render(request, template_name, context)
 
@@ -69,6 +87,7 @@ def create_feedback(request):
     return render(request, template_name, context)
 
 
+@anonymous_page("feedback", (Review,))
 def review(request):
     template_name = "shop/feedback.html"
     reviews = Review.objects.order_by("-id")[:5]
@@ -86,15 +105,23 @@ class LightMotorSpecificationView(DetailView):
         return slug_url_kwarg
 
 
+@method_decorator(anonymous_page("category", CATALOGUE_MODELS), name="get")
 class CategoryDetailView(DetailView, CartMixin, CategoryDetailMixin):
     model = Category
 
     def get(self, request, *args, **kwargs):
-        category_slug = kwargs.get("slug")
-        categories = Category.objects.all().get(slug=category_slug)
+        category = get_object_or_404(Category, slug=kwargs.get("slug"))
+        selected_facets = facets.get_selected_facets(request.GET)
+        products = facets.filter_products(self.get_category_products(category), selected_facets)
+        page = self.get_page(request, products)
+        model = registry.get_category_model(category.slug)
         template_name = "shop/category_detail.html"
         context = {
-            "categories": categories
+            "category": category,
+            "categories": cache.get_categories_for_left_sidebar(),
+            "category_products": page.items,
+            "page": page,
+            "facets": facets.get_facet_counts(model, selected_facets, category) if model else [],
         }
         return render(request, template_name, context)
 
@@ -114,35 +141,27 @@ class CategoryDetailView(DetailView, CartMixin, CategoryDetailMixin):
 
 
 class AddToCartView(CartMixin, View):
-    model = LightMotor
+    model = Product
 
     def get(self, request, *args, **kwargs):
         product_slug = kwargs.get("slug")
-        product = LightMotor.objects.get(slug=product_slug)
-        product_cart, created = ProductCart.objects.get_or_create(
-            user=self.cart.owner, cart=self.cart, product_id=str(product.id)
-        )
-
-        if created:
-            self.cart.product.add(product_cart)
-        recalc_cart(self.cart)
+        product = get_object_or_404(Product.objects.only("id", "price"), slug=product_slug)
+        try:
+            cart_service.add_product(self.cart, product)
+        except stock.OutOfStock:
+            messages.add_message(request, messages.INFO, OUT_OF_STOCK_MESSAGE)
+            return HttpResponseRedirect("/shop/cart/")
         messages.add_message(request, messages.INFO, "Товар успешно добавлен.")
         return HttpResponseRedirect("/shop/cart/")
 
 
 class DeleteFromCartView(CartMixin, View):
-    model = LightMotor
+    model = Product
 
     def get(self, request, *args, **kwargs):
         product_slug = kwargs.get("slug")
-        product = LightMotor.objects.get(slug=product_slug)
-        product_cart = ProductCart.objects.get(
-            user=self.cart.owner, cart=self.cart, product_id=str(product.id)
-        )
-
-        self.cart.product.remove(product_cart)
-        product_cart.delete()
-        recalc_cart(self.cart)
+        product = get_object_or_404(Product.objects.only("id", "price"), slug=product_slug)
+        cart_service.remove_product(self.cart, product)
         messages.add_message(request, messages.INFO, "Товар успешно удален.")
         return HttpResponseRedirect("/shop/cart/")
 
@@ -151,14 +170,16 @@ class ChangeQuantityView(CartMixin, View):
 
     def post(self, request, *args, **kwargs):
         product_slug = kwargs.get("slug")
-        product = LightMotor.objects.get(slug=product_slug)
-        product_cart = ProductCart.objects.get(
-            user=self.cart.owner, cart=self.cart, product=self.cart.product, product_id=product
-        )
-        quantity = int(request.POST.get("quantity"))
-        product_cart.quantity = quantity
-        product_cart.save()
-        recalc_cart(self.cart)
+        product = get_object_or_404(Product.objects.only("id", "price"), slug=product_slug)
+        quantity = parse_quantity(request.POST.get("quantity"))
+        if quantity is None:
+            messages.add_message(request, messages.INFO, INVALID_QUANTITY_MESSAGE)
+            return HttpResponseRedirect("/shop/cart/")
+        try:
+            cart_service.change_quantity(self.cart, product, quantity)
+        except stock.OutOfStock:
+            messages.add_message(request, messages.INFO, OUT_OF_STOCK_MESSAGE)
+            return HttpResponseRedirect("/shop/cart/")
         messages.add_message(request, messages.INFO, "Кол-во успешно изменено.")
         return HttpResponseRedirect("/shop/cart/")
 
@@ -167,12 +188,11 @@ class CartView(CartMixin, View):
     model = LightMotor
 
     def get(self, request, *args, **kwargs):
-        products = LightMotor.objects.all()
-        categories = Category.objects.get_categories_for_left_sidebar()
+        categories = cache.get_categories_for_left_sidebar()
         template_name = "shop/cart.html"
         context = {
             "cart": self.cart,
-            "products": products,
+            "cart_lines": cart_service.get_lines(self.cart),
             "categories": categories
         }
         return render(request, template_name, context)
@@ -182,13 +202,12 @@ class CheckoutView(CartMixin, View):
     model = LightMotor
 
     def get(self, request, *args, **kwargs):
-        products = LightMotor.objects.all()
         form = OrderForm(request.POST or None)
-        categories = Category.objects.get_categories_for_left_sidebar()
+        categories = cache.get_categories_for_left_sidebar()
         template_name = "shop/checkout.html"
         context = {
             "cart": self.cart,
-            "products": products,
+            "cart_lines": cart_service.get_lines(self.cart),
             "form": form,
             "categories": categories
         }
@@ -197,11 +216,26 @@ class CheckoutView(CartMixin, View):
 
 class MakeOrderView(CartMixin, View):
 
-    @transaction.atomic
     def post(self, request, *args, **kwargs):
+        if request.customer is None:
+            messages.add_message(request, messages.INFO, LOGIN_REQUIRED_MESSAGE)
+            return HttpResponseRedirect("/shop/cart/")
+        # the lazy cart is loaded before the transaction, so that its first statement takes the write lock
+        cart_id = self.cart.pk
+        try:
+            return self.make_order(request, cart_id)
+        except stock.OutOfStock:
+            messages.add_message(request, messages.INFO, OUT_OF_STOCK_MESSAGE)
+            return HttpResponseRedirect("/shop/cart/")
+
+    @transaction.atomic
+    def make_order(self, request, cart_id):
         form = OrderForm(request.POST or None)
-        customer = Customer.objects.get(user=request.user)
+        customer = request.customer
         if form.is_valid():
+            if not cart_service.lock_for_checkout(cart_id):
+                return HttpResponseRedirect("/shop/")
+            stock.commit_cart(self.cart)
             new_order = form.save(commit=False)
             new_order.customer = customer
             new_order.first_name = form.cleaned_data["first_name"]
@@ -216,6 +250,7 @@ class MakeOrderView(CartMixin, View):
             self.cart.save()
             new_order.cart = self.cart
             new_order.save()
+            cart_service.snapshot_order_lines(new_order, self.cart)
             customer.orders.add(new_order)
             messages.add_message(request, messages.INFO,
                                  "Спасибо за заказ! Наш менеджер свяжется с вами в ближайшее время.")
@@ -225,6 +260,20 @@ class MakeOrderView(CartMixin, View):
         return HttpResponseRedirect("/shop/checkout/")
 
 
+class OrderHistoryView(CartMixin, View):
+
+    def get(self, request, *args, **kwargs):
+        if request.customer is None:
+            return HttpResponseRedirect("/shop/")
+        orders = request.customer.related_orders.order_by("-id").prefetch_related("lines")
+        context = {
+            "orders": orders,
+            "categories": cache.get_categories_for_left_sidebar(),
+        }
+        return render(request, "shop/orders.html", context)
+
+
+@method_decorator(anonymous_page("light_motors", (Category, LightMotor)), name="get")
 class LightMotorDetailView(DetailView):
     model = LightMotor
 
@@ -240,3 +289,51 @@ class LightMotorDetailView(DetailView):
 
     context_object_name = "light_motors"
     slug_url_kwarg = "slug"
+
+
+def category_products_api(request, slug):
+    ordering = request.GET.get("order", "created")
+    if ordering not in ORDERINGS:
+        return HttpResponseBadRequest("Unknown ordering")
+    try:
+        per_page = int(request.GET["limit"]) if "limit" in request.GET else None
+        products = facets.filter_products(
+            Product.objects.filter(category__slug=slug, available=True), facets.get_selected_facets(request.GET)
+        )
+        page = paginate(
+            products.values(*CategoryDetailMixin.LISTING_FIELDS),
+            ordering, request.GET.get("cursor"), per_page
+        )
+    except (InvalidCursor, ValueError):
+        return HttpResponseBadRequest("Invalid cursor")
+    if not page.items and not request.GET.get("cursor") and not Category.objects.filter(slug=slug).exists():
+        raise Http404("Category not found")
+    return JsonResponse({"results": page.items, "next": page.next_cursor})
+
+
+def search_view(request):
+    template_name = "shop/search.html"
+    query = request.GET.get("q", "").strip()
+    products = search.search_products(query) if query else []
+    return render(request, template_name, {"query": query, "products": products})
+
+
+def autocomplete(request):
+    return JsonResponse({"results": search.autocomplete(request.GET.get("q", ""))})
+
+
+def has_metrics_token(request):
+    token = getattr(settings, "SHOP_METRICS_TOKEN", None)
+    if not token:
+        return False
+    header = request.META.get("HTTP_AUTHORIZATION", "")
+    return hmac.compare_digest(header.encode(), f"Bearer {token}".encode())
+
+
+def metrics_view(request):
+    if not (request.user.is_staff or has_metrics_token(request)):
+        raise Http404
+    summary = profiling.metrics.summary()
+    if request.GET.get("format") == "prometheus":
+        return HttpResponse(profiling.render_prometheus(summary), content_type="text/plain; version=0.0.4")
+    return JsonResponse({"views": summary})
@@ -0,0 +1,31 @@
+from django import template
+from django.core.files.storage import default_storage
+
+from shop.images import RENDITION_SIZES, rendition_path
+
+register = template.Library()
+
+
+@register.simple_tag
+def rendition(image_hash, size="card", image_format="jpeg", fallback=""):
+    if not image_hash:
+        return fallback
+    return default_storage.url(rendition_path(image_hash, size, image_format))
+
+
+@register.filter
+def media_url(name):
+    return default_storage.url(name) if name else ""
+
+
+@register.inclusion_tag("shop/picture.html")
+def picture(image_hash, size="card", alt="", css_class="", fallback=""):
+    width, height = RENDITION_SIZES[size]
+    return {
+        "webp": rendition(image_hash, size, "webp"),
+        "jpeg": rendition(image_hash, size, "jpeg", fallback),
+        "width": width,
+        "height": height,
+        "alt": alt,
+        "css_class": css_class,
+    }
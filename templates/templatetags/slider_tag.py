@@ -1,10 +1,40 @@
 from django import template
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from shop import cache
+from shop.images import RENDITION_SIZES, SLIDER_RENDITIONS
 from shop.models import Slider
+from .renditions import rendition
 
 register = template.Library()
 
 
-@register.inclusion_tag("shop/widget_slider_home_page.html")
+def get_srcset(image_hash, image_format):
+    return ", ".join(
+        "{} {}w".format(rendition(image_hash, size, image_format), RENDITION_SIZES[size][0])
+        for size in SLIDER_RENDITIONS
+    )
+
+
+def render_slider():
+    width, height = RENDITION_SIZES["slider"]
+    slides = [
+        {
+            "slide": slide,
+            "webp_srcset": get_srcset(slide.slide_img_hash, "webp") if slide.slide_img_hash else "",
+            "jpeg_srcset": get_srcset(slide.slide_img_hash, "jpeg") if slide.slide_img_hash else "",
+            "src": rendition(slide.slide_img_hash, "slider", fallback=slide.slide_img.url),
+        }
+        for slide in Slider.objects.order_by("id")
+    ]
+    return render_to_string("shop/widget_slider_home_page.html", {
+        "slides": slides,
+        "width": width,
+        "height": height,
+    })
+
+
+@register.simple_tag
 def block_slider():
-    slider_block = Slider.objects.all()
-    return {"slider_block": slider_block}
+    return mark_safe(cache.get_or_build("slider", (Slider,), render_slider))
@@ -1,7 +1,10 @@
+from html import escape
+
 from django import template
+from django.conf import settings
 from django.utils.safestring import mark_safe
 
-from shop.models import LightMotor
+from shop.models import CommercialVehicles, LightMotor
 
 register = template.Library()
 
@@ -24,44 +27,60 @@ TABLE_CONTENT = """
                 """
 
 PRODUCT_SPEC = {
-    "light_motor": {
-        "Группа продукта": "product_group",
-        "Состав продукта": "composition",
-        "Вязкость продукта": "viscosity",
-        "Объем": "volume",
-        "Классификация продукта": "classification",
-        "Одобрение производителей": "manufacturer_approval",
-        "Под конкретную модель": "under_a_specific_brand",
-        "Марка автомобиля": "brand",
-        "Год выпуска": "year_of_issue",
-
-    },
-    "commercial_vehicles": {
-        "Группа продукта": "product_group",
-        "Состав продукта": "composition",
-        "Вязкость продукта": "viscosity",
-        "Классификация продукта": "classification",
-        "Одобрение производителей": "manufacturer_approval",
-        "Объем": "volume"
-    }
+    LightMotor: (
+        ("Группа продукта", "product_group"),
+        ("Состав продукта", "composition"),
+        ("Вязкость продукта", "viscosity"),
+        ("Объем", "volume"),
+        ("Классификация продукта", "classification"),
+        ("Одобрение производителей", "manufacturer_approval"),
+        ("Под конкретную модель", "under_a_specific_brand"),
+        ("Марка автомобиля", "brand"),
+        ("Год выпуска", "year_of_issue"),
+    ),
+    CommercialVehicles: (
+        ("Группа продукта", "product_group"),
+        ("Состав продукта", "composition"),
+        ("Вязкость продукта", "viscosity"),
+        ("Классификация продукта", "classification"),
+        ("Одобрение производителей", "manufacturer_approval"),
+        ("Объем", "volume"),
+    ),
 }
 
+BRAND_FIELDS = frozenset(("brand", "year_of_issue"))
+
+_spec_cache = {}
+
+
+def compile_layout(spec):
+    row_head, row_tail = TABLE_CONTENT.split("{value}")
+    return tuple((row_head.format(name=escape(name)), field, row_tail) for name, field in spec)
+
+
+SPEC_LAYOUTS = {model: compile_layout(spec) for model, spec in PRODUCT_SPEC.items()}
+
 
-def get_product_spec(product, model_name):
-    table_content = ""
-    for name, value in PRODUCT_SPEC[model_name].items():
-        table_content += TABLE_CONTENT.format(name=name, value=getattr(product, value))
-    return table_content
+def render_product_spec(product, layout):
+    skip_brand = isinstance(product, LightMotor) and not product.under_a_specific_brand
+    rows = "".join([
+        row_head + escape(str(getattr(product, field))) + row_tail
+        for row_head, field, row_tail in layout
+        if not (skip_brand and field in BRAND_FIELDS)
+    ])
+    return "".join((TABLE_HEAD, rows, TABLE_TAIL))
 
 
 @register.filter
 def product_spec(product):
-    model_name = product.__class__._meta.model_name
-    if isinstance(product, LightMotor):
-        if not product.under_a_specific_brand:
-            PRODUCT_SPEC["light_motor"].pop("Марка автомобиля")
-            PRODUCT_SPEC["light_motor"].pop("Год выпуска")
-        else:
-            PRODUCT_SPEC["light_motor"]["Марка автомобиля"] = "brand"
-            PRODUCT_SPEC["light_motor"]["Год выпуска"] = "year_of_issue"
-        return mark_safe(TABLE_HEAD + get_product_spec(product, model_name) + TABLE_TAIL)
+    layout = SPEC_LAYOUTS.get(type(product))
+    if layout is None:
+        return ""
+    key = (type(product), product.pk, product.updated)
+    html = _spec_cache.get(key)
+    if html is None:
+        html = render_product_spec(product, layout)
+        if len(_spec_cache) >= getattr(settings, "SHOP_SPEC_CACHE_SIZE", 10000):
+            _spec_cache.clear()
+        _spec_cache[key] = html
+    return mark_safe(html)